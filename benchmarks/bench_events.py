@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from synthetic import create_habits_db
+from habit_repository import HISTORY_PAGE_SIZE, HabitRepository
+
+# Страница истории через OFFSET — так читалась бы история без постраничного курсора
+SELECT_HISTORY_OFFSET = (
+    'SELECT e.id, e.habit_id, h.habit_name, e.kind, e.amount, e.progress, e.created_at '
+    'FROM habit_events e JOIN habits h ON h.id = e.habit_id '
+    'WHERE e.user_id = ? ORDER BY e.id DESC LIMIT ? OFFSET ?'
+)
+
+
+def fill_events(path, events_per_user, users):
+    # Журнал отметок: events_per_user событий у каждого из первых users пользователей
+    conn = sqlite3.connect(path)
+    habits = conn.execute('SELECT id, user_id FROM habits WHERE user_id <= ?', (users,)).fetchall()
+    now = int(time.time())
+    rows = (
+        (habit_id, user_id, 'complete', 1, i, now - i)
+        for i in range(events_per_user // 5 + 1) for habit_id, user_id in habits
+    )
+    conn.executemany(
+        'INSERT INTO habit_events (habit_id, user_id, kind, amount, progress, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+        rows,
+    )
+    conn.commit()
+    conn.close()
+
+
+async def completions(path, operations, concurrency, seed):
+    # concurrency одновременных отметок разных пользователей: группируются в общие транзакции
+    conn = sqlite3.connect(path)
+    habits = conn.execute('SELECT id, user_id FROM habits WHERE archived = 0').fetchall()
+    conn.close()
+    rng = random.Random(seed)
+    repository = HabitRepository(path)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def complete(habit_id, user_id):
+        async with semaphore:
+            await repository.complete_habit_by_id(user_id, habit_id, step=0)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(complete(*rng.choice(habits)) for _ in range(operations)))
+        return time.perf_counter() - started
+    finally:
+        await repository.close()
+
+
+async def history_pages(path, user_id, pages):
+    # Листание истории до страницы pages: курсор по id против OFFSET
+    repository = HabitRepository(path)
+    try:
+        started = time.perf_counter()
+        before_id = None
+        for _ in range(pages):
+            events = await repository.list_history(user_id, before_id)
+            before_id = events[-1].id
+        keyset = time.perf_counter() - started
+    finally:
+        await repository.close()
+
+    conn = sqlite3.connect(path)
+    started = time.perf_counter()
+    for page in range(pages):
+        conn.execute(SELECT_HISTORY_OFFSET, (user_id, HISTORY_PAGE_SIZE, page * HISTORY_PAGE_SIZE)).fetchall()
+    offset = time.perf_counter() - started
+    conn.close()
+    return keyset, offset
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'events.db')
+        create_habits_db(path, args.habits)
+        fill_events(path, args.events_per_user, users=10)
+        print(f'привычек: {args.habits}, событий у пользователя: ~{args.events_per_user}')
+
+        for concurrency in (1, 16, 128):
+            elapsed = asyncio.run(completions(path, args.writes, concurrency, seed=concurrency))
+            print(f'отметки, одновременно {concurrency:>3}: {args.writes / elapsed:.0f}/с')
+
+        pages = args.events_per_user // HISTORY_PAGE_SIZE
+        keyset, offset = asyncio.run(history_pages(path, 1, pages))
+        print(f'история, {pages} страниц: курсор {keyset * 1000:.1f} мс, OFFSET {offset * 1000:.1f} мс')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Журнал отметок: групповая запись и постраничная история')
+    parser.add_argument('--habits', type=int, default=100_000)
+    parser.add_argument('--events-per-user', type=int, default=5_000)
+    parser.add_argument('--writes', type=int, default=5_000)
+    main(parser.parse_args())
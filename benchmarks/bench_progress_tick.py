@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import aiosqlite
+
+from synthetic import create_habits_db
+from habit_repository import HabitRepository
+from scheduler_tasks import SchedulerTasks
+
+
+async def legacy_tick(path, tasks):
+    # Прежняя реализация: все строки в Python и по одному UPDATE на привычку
+    async with aiosqlite.connect(path) as conn:
+        async with conn.execute('SELECT id, progress, total, frequency FROM habits WHERE archived = 0') as cursor:
+            habits = await cursor.fetchall()
+        for habit_id, progress, total, frequency in habits:
+            new_progress = progress + tasks._calculate_increment(frequency, total)
+            if new_progress >= total:
+                await conn.execute('UPDATE habits SET progress = ?, archived = 1 WHERE id = ?', (total, habit_id))
+            else:
+                await conn.execute('UPDATE habits SET progress = ? WHERE id = ?', (new_progress, habit_id))
+        await conn.commit()
+
+
+async def bulk_tick(path, tasks):
+    repository = HabitRepository(path)
+    tasks.repository = repository
+    await tasks.update_progress()
+    await repository.close()
+
+
+async def main(counts, skip_legacy):
+    tasks = SchedulerTasks(None, None)
+    print(f"{'habits':>10} {'legacy, s':>10} {'bulk, s':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        for count in counts:
+            legacy = float('nan')
+            if not skip_legacy:
+                create_habits_db(path, count)
+                started = time.perf_counter()
+                await legacy_tick(path, tasks)
+                legacy = time.perf_counter() - started
+
+            create_habits_db(path, count)
+            started = time.perf_counter()
+            await bulk_tick(path, tasks)
+            bulk = time.perf_counter() - started
+            print(f'{count:>10} {legacy:>10.3f} {bulk:>10.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Время часового тика прогресса от числа привычек')
+    parser.add_argument('counts', nargs='*', type=int, default=[1_000, 10_000, 100_000])
+    parser.add_argument('--skip-legacy', action='store_true', help='не измерять построчный вариант')
+    args = parser.parse_args()
+    asyncio.run(main(args.counts, args.skip_legacy))
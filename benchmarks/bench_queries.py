@@ -0,0 +1,79 @@
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from synthetic import create_habits_db
+from migrations import migrate
+
+# Пути запросов из обработчиков и планировщика с типичными параметрами
+QUERIES = {
+    'check_progress': (
+        'SELECT id, habit_name, frequency, progress, total, start_date FROM habits WHERE user_id = ? AND archived = 0',
+        lambda rng, users: (rng.randint(1, users),),
+    ),
+    'complete_habit': (
+        'SELECT id, habit_name, frequency, progress, total, start_date FROM habits '
+        'WHERE id = ? AND user_id = ? AND archived = 0',
+        lambda rng, users: (rng.randint(1, users * 5), rng.randint(1, users)),
+    ),
+    'delete_habit': (
+        'SELECT habit_name, progress FROM habits WHERE id = ? AND user_id = ?',
+        lambda rng, users: (rng.randint(1, users * 5), rng.randint(1, users)),
+    ),
+    'reminder_batch': (
+        'SELECT user_id, json_group_array(json_array(id, habit_name, frequency)) FROM habits '
+        'WHERE user_id IN ({}) AND archived = 0 AND is_blocked = 0 AND frequency NOT IN (?) '
+        'GROUP BY user_id'.format(', '.join('?' * 100)),
+        lambda rng, users: (*rng.sample(range(1, users + 1), 100), 'Еженедельно'),
+    ),
+    'archive_due_scan': (
+        'SELECT COUNT(*) FROM habits WHERE archived = 0 AND due_at <= ?',
+        lambda rng, users: (int(time.time()),),
+    ),
+}
+
+
+def run(path, users, repeat):
+    conn = sqlite3.connect(path)
+    rng = random.Random(1)
+    results = {}
+    for name, (sql, params) in QUERIES.items():
+        plan = ' / '.join(row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params(rng, users)))
+        started = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params(rng, users)).fetchall()
+        results[name] = ((time.perf_counter() - started) / repeat * 1000, plan)
+    conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Время запросов до и после индексов миграций')
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    users = args.rows // 5
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        create_habits_db(path, args.rows, migrated=False)
+        # Колонка due_at появляется в миграции; без неё сравнивать нечего
+        sqlite3.connect(path).execute('ALTER TABLE habits ADD COLUMN due_at INTEGER')
+        before = run(path, users, args.repeat)
+
+        started = time.perf_counter()
+        migrate(path)
+        migration_time = time.perf_counter() - started
+        after = run(path, users, args.repeat)
+
+    print(f'{args.rows} строк, миграции: {migration_time:.2f} с')
+    print(f"{'запрос':<18} {'без индексов, мс':>17} {'с индексами, мс':>16}  план")
+    for name in QUERIES:
+        print(f'{name:<18} {before[name][0]:>17.3f} {after[name][0]:>16.3f}  {after[name][1]}')
+
+
+if __name__ == '__main__':
+    main()
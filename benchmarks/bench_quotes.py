@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+import synthetic  # noqa: F401  (путь к модулям бота)
+from quote_store import QuoteStore, permute
+
+TAGS = ('спорт', 'утро', 'учёба', 'работа', 'здоровье')
+
+
+def write_corpus(path, count, seed=1):
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            item = {
+                'text': f'Цитата номер {i}: маленький шаг каждый день важнее большого рывка раз в год.',
+                'lang': 'ru' if rng.random() < 0.8 else 'en',
+                'tags': rng.sample(TAGS, rng.randint(0, 2)),
+            }
+            f.write(json.dumps(item, ensure_ascii=False) + '\n')
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'quotes.jsonl')
+        write_corpus(path, args.quotes)
+        size_mb = os.path.getsize(path) / 2 ** 20
+
+        store = QuoteStore(path)
+        started = time.perf_counter()
+        store.load()
+        load_time = time.perf_counter() - started
+    # Память индекса: тексты, смещения и массивы номеров пулов
+    index = store.index
+    memory_mb = (sys.getsizeof(index._data) + sys.getsizeof(index._offsets)
+                 + sum(sys.getsizeof(numbers) for numbers in index._pools.values())) / 2 ** 20
+    print(f'цитат: {len(store.index)}, файл {size_mb:.0f} МБ, загрузка {load_time:.2f} с, индекс {memory_mb:.0f} МБ')
+
+    # Выбор цитаты без обращения к базе: пул, позиция в перестановке, текст
+    rng = random.Random(2)
+    started = time.perf_counter()
+    for _ in range(args.picks):
+        index, pool, numbers = store.select(rng.choice(('ru', 'en', None)), rng.choice((None,) + TAGS))
+        index.text(numbers[permute(rng.randrange(len(numbers)), len(numbers), rng.getrandbits(63))])
+    print(f'выбор цитаты: {(time.perf_counter() - started) / args.picks * 1e6:.1f} мкс')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Загрузка корпуса цитат и выбор цитаты по ротации')
+    parser.add_argument('--quotes', type=int, default=1_000_000)
+    parser.add_argument('--picks', type=int, default=100_000)
+    main(parser.parse_args())
@@ -0,0 +1,108 @@
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from synthetic import create_habits_db
+from fake_bot_api import FakeBotAPI
+from habit_repository import HabitRepository
+from reminder_dispatcher import CONCURRENCY, ReminderDispatcher
+from scheduler_tasks import SchedulerTasks
+
+TOKEN = '123456:scheduler-bench'
+
+
+class TimedBot:
+    # Обёртка над Bot: замеряет длительность каждого send_message
+    def __init__(self, bot):
+        self.bot = bot
+        self.latencies = []
+
+    async def send_message(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await self.bot.send_message(*args, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+async def bench(path, count, bot, api, args):
+    create_habits_db(path, count)
+    repository = HabitRepository(path)
+    timed_bot = TimedBot(bot)
+    tasks = SchedulerTasks(timed_bot, repository)
+    # Лимиты Telegram в фейковом API не действуют; по умолчанию меряем сам конвейер
+    tasks.dispatcher = ReminderDispatcher(timed_bot, repository, rate=args.rate, per_chat_interval=0)
+
+    started = time.perf_counter()
+    await tasks.update_progress()
+    progress_time = time.perf_counter() - started
+
+    # Наступившими делаем слоты не более чем max_reminders пользователей
+    await repository.ensure_reminder_slots()
+    conn = sqlite3.connect(path)
+    conn.execute(
+        'UPDATE reminder_slots SET next_due_at = 0 WHERE user_id IN '
+        '(SELECT user_id FROM reminder_slots ORDER BY user_id LIMIT ?)', (args.max_reminders,)
+    )
+    conn.commit()
+    conn.close()
+
+    api.reset()
+    started = time.perf_counter()
+    await tasks.send_reminder()
+    reminder_time = time.perf_counter() - started
+    await repository.close()
+
+    sent = api.report()['messages_sent']
+    return {
+        'progress': progress_time,
+        'reminder': reminder_time,
+        'sent': sent,
+        'rate': sent / reminder_time if reminder_time else 0.0,
+        'p50': statistics.median(timed_bot.latencies) * 1000 if timed_bot.latencies else float('nan'),
+        'p99': percentile(timed_bot.latencies, 0.99) * 1000,
+    }
+
+
+async def main(args):
+    api = FakeBotAPI(port=args.api_port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                     flood_rate=args.flood_rate, blocked_rate=args.blocked_rate)
+    await api.start()
+    bot = Bot(TOKEN, base_url=f'{api.base_url}/bot', request=HTTPXRequest(connection_pool_size=CONCURRENCY))
+    await bot.initialize()
+
+    print(f"{'привычек':>9} {'тик, с':>8} {'рассылка, с':>12} {'сообщений':>10} {'сообщ./с':>9} "
+          f"{'p50, мс':>8} {'p99, мс':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in args.counts:
+            result = await bench(os.path.join(tmp, f'bench-{count}.db'), count, bot, api, args)
+            print(f"{count:>9} {result['progress']:>8.2f} {result['reminder']:>12.2f} {result['sent']:>10} "
+                  f"{result['rate']:>9.0f} {result['p50']:>8.1f} {result['p99']:>8.1f}")
+
+    await bot.shutdown()
+    await api.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Тик прогресса и рассылка напоминаний против фейкового Bot API')
+    parser.add_argument('counts', nargs='*', type=int, default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--max-reminders', type=int, default=10_000, help='сколько пользователей получат напоминание')
+    parser.add_argument('--rate', type=float, default=10_000, help='общий лимит диспетчера, сообщений/с')
+    parser.add_argument('--api-port', type=int, default=18081)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--jitter-ms', type=float, default=10.0)
+    parser.add_argument('--flood-rate', type=float, default=0.0)
+    parser.add_argument('--blocked-rate', type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,85 @@
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from synthetic import create_habits_db
+from habit_repository import HabitRepository
+from progress import HOURLY_INCREMENTS
+from rebalance_shards import rebalance
+from sharding import shard_db_path
+
+
+def tick(path):
+    async def run():
+        repository = HabitRepository(path)
+        try:
+            return await repository.tick_progress(HOURLY_INCREMENTS)
+        finally:
+            await repository.close()
+    return asyncio.run(run())
+
+
+def complete(path, operations, seed):
+    # Отметки привычек случайных пользователей шарда — запись, как у обработчиков
+    conn = sqlite3.connect(path)
+    habits = conn.execute('SELECT id, user_id FROM habits WHERE archived = 0').fetchall()
+    conn.close()
+
+    async def run():
+        repository = HabitRepository(path)
+        rng = random.Random(seed)
+        try:
+            for _ in range(operations):
+                habit_id, user_id = rng.choice(habits)
+                await repository.complete_habit_by_id(user_id, habit_id, step=0)
+        finally:
+            await repository.close()
+    started = time.perf_counter()
+    asyncio.run(run())
+    return time.perf_counter() - started
+
+
+def parallel(function, args_list):
+    started = time.perf_counter()
+    with ProcessPoolExecutor(len(args_list)) as pool:
+        list(pool.map(function, *zip(*args_list)))
+    return time.perf_counter() - started
+
+
+def main(args):
+    print(f'привычек: {args.habits}, шардов: {args.shards}, ядер: {os.cpu_count()}')
+    with tempfile.TemporaryDirectory() as tmp:
+        single = os.path.join(tmp, 'single.db')
+        sharded = os.path.join(tmp, 'sharded.db')
+        create_habits_db(single, args.habits)
+        create_habits_db(sharded, args.habits)
+
+        started = time.perf_counter()
+        rebalance(sharded, 1, args.shards)
+        print(f'разбиение 1 -> {args.shards} шардов: {time.perf_counter() - started:.2f} с')
+        paths = [shard_db_path(sharded, shard) for shard in range(args.shards)]
+
+        single_tick = parallel(tick, [(single,)])
+        sharded_tick = parallel(tick, [(path,) for path in paths])
+        print(f'тик прогресса: одна база {single_tick:.2f} с, шарды параллельно {sharded_tick:.2f} с')
+
+        # Столько же процессов-писателей: все в одну базу или каждый в свой шард
+        operations = args.writes // args.shards
+        single_writes = parallel(complete, [(single, operations, seed) for seed in range(args.shards)])
+        sharded_writes = parallel(complete, [(path, operations, seed) for seed, path in enumerate(paths)])
+        total = operations * args.shards
+        print(f'отметки ({total} шт., {args.shards} процессов): одна база {total / single_writes:.0f}/с, '
+              f'шарды {total / sharded_writes:.0f}/с')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Одна база против шардов: тик прогресса и запись отметок')
+    parser.add_argument('--habits', type=int, default=1_000_000)
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--writes', type=int, default=20_000)
+    main(parser.parse_args())
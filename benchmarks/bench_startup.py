@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from synthetic import create_habits_db
+from fake_bot_api import FakeBotAPI
+
+TOKEN = '123456:startup-bench'
+
+
+async def child(args):
+    # Процесс бота: время каждого этапа считается от запуска процесса родителем
+    from bot_moti import HabitTrackerBot
+    imported = time.time()
+    bot = HabitTrackerBot(TOKEN, db_path=args.db, base_url=f'{args.api}/bot')
+    constructed = time.time()
+    async with bot.app:
+        # initialize: getMe, схема и пул соединений, загрузка состояния диалогов
+        initialized = time.time()
+        await bot.lifecycle.startup()
+        await bot.app.start()
+        ready = time.time()
+        # Тем временем идёт рассылка оставшегося в outbox — остановка застанет её на середине
+        await asyncio.sleep(args.run_seconds)
+        stopping = time.time()
+        await bot.app.stop()
+        await bot.lifecycle.drain()
+    await bot.lifecycle.shutdown()
+    stopped = time.time()
+    print(json.dumps({
+        'imports': imported - args.spawned_at,
+        'construct': constructed - args.spawned_at,
+        'initialize': initialized - args.spawned_at,
+        'ready': ready - args.spawned_at,
+        'shutdown': stopped - stopping,
+    }))
+
+
+async def run_bot(path, api, run_seconds):
+    spawned_at = time.time()
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), '--child', '--db', path, '--api', api.base_url,
+        '--spawned-at', repr(spawned_at), '--run-seconds', str(run_seconds),
+        stdout=asyncio.subprocess.PIPE,
+    )
+    stdout, _ = await process.communicate()
+    if process.returncode:
+        raise RuntimeError(f'Процесс бота завершился с кодом {process.returncode}')
+    return json.loads(stdout.decode().strip().splitlines()[-1])
+
+
+def fill_outbox(path, count):
+    # Напоминания, не разосланные до перезапуска: бот досылает их сразу после старта
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        'INSERT INTO reminder_outbox (dedup_key, user_id, text, created_at) VALUES (?, ?, ?, ?)',
+        ((f'bench:{user_id}', user_id, 'Напоминание', int(time.time())) for user_id in range(1, count + 1)),
+    )
+    conn.commit()
+    conn.close()
+
+
+def outbox_statuses(path):
+    conn = sqlite3.connect(path)
+    statuses = dict(conn.execute('SELECT status, COUNT(*) FROM reminder_outbox GROUP BY status').fetchall())
+    conn.close()
+    return statuses
+
+
+def report(name, timings):
+    stages = ' '.join(f'{stage} {timings[stage]:.2f}' for stage in ('imports', 'construct', 'initialize', 'ready'))
+    print(f'{name:<10} {stages}; остановка {timings["shutdown"]:.2f} с')
+
+
+async def main(args):
+    api = FakeBotAPI(port=args.api_port, latency_ms=args.latency_ms)
+    await api.start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'startup.db')
+            # Первый запуск после обновления: база в старой схеме, миграции при старте
+            create_habits_db(path, args.habits, migrated=False)
+            print(f'привычек: {args.habits}, напоминаний в outbox: {args.outbox}; секунды от запуска процесса')
+            report('миграции', await run_bot(path, api, 0))
+
+            fill_outbox(path, args.outbox)
+            restart = await run_bot(path, api, args.run_seconds)
+            report('перезапуск', restart)
+            statuses = outbox_statuses(path)
+            print(f'outbox после остановки: {statuses} — неотправленные остались pending и уйдут после запуска')
+    finally:
+        await api.stop()
+
+    if restart['ready'] > args.target:
+        print(f'Готовность за {restart["ready"]:.2f} с — дольше цели {args.target:.2f} с')
+        sys.exit(1)
+    print(f'Готовность за {restart["ready"]:.2f} с — в пределах цели {args.target:.2f} с')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Время запуска и остановки бота для скользящих перезапусков')
+    parser.add_argument('--habits', type=int, default=200_000)
+    parser.add_argument('--outbox', type=int, default=2_000)
+    parser.add_argument('--run-seconds', type=float, default=2.0, help='сколько бот работает перед остановкой')
+    parser.add_argument('--target', type=float, default=3.0, help='цель по времени готовности, с')
+    parser.add_argument('--api-port', type=int, default=18082)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--api', help=argparse.SUPPRESS)
+    parser.add_argument('--spawned-at', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    asyncio.run(child(args) if args.child else main(args))
@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import statistics
+import time
+
+from aiohttp import ClientSession
+from telegram import Update
+from telegram.ext import Application, TypeHandler
+
+import synthetic  # noqa: F401  (путь к модулям бота)
+from fake_bot_api import FakeBotAPI
+from update_processor import PerUserUpdateProcessor
+from webhook_server import SECRET_HEADER, WebhookServer
+
+API_PORT = 18081
+WEBHOOK_PORT = 18080
+SECRET = 'bench-secret'
+TOKEN = '123456:bench'
+
+
+def fake_update(update_id, user_id, seq):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'user'},
+            'text': f'{seq} {time.perf_counter()}',
+        },
+    }
+
+
+async def main(updates, users, concurrency, work_ms):
+    api = FakeBotAPI(port=API_PORT)
+    await api.start()
+
+    latencies = []
+    last_seq = {}
+    out_of_order = 0
+    done = asyncio.Event()
+
+    async def handle(update, context):
+        nonlocal out_of_order
+        seq, sent_at = update.message.text.split()
+        # Имитация работы обработчика (запрос к базе, ответ пользователю)
+        await asyncio.sleep(work_ms / 1000)
+        latencies.append(time.perf_counter() - float(sent_at))
+        user_id = update.effective_user.id
+        if int(seq) < last_seq.get(user_id, -1):
+            out_of_order += 1
+        last_seq[user_id] = int(seq)
+        if len(latencies) == updates:
+            done.set()
+
+    application = (
+        Application.builder()
+        .token(TOKEN)
+        .base_url(f'{api.base_url}/bot')
+        .concurrent_updates(PerUserUpdateProcessor())
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, handle))
+    server = WebhookServer(application, '127.0.0.1', WEBHOOK_PORT, SECRET)
+
+    async with application:
+        await application.start()
+        await server.start()
+
+        semaphore = asyncio.Semaphore(concurrency)
+        url = f'http://127.0.0.1:{WEBHOOK_PORT}{server.path}'
+        async with ClientSession(headers={SECRET_HEADER: SECRET}) as session:
+            async def post(i):
+                async with semaphore:
+                    async with session.post(url, json=fake_update(i, i % users + 1, i // users)) as response:
+                        response.raise_for_status()
+
+            started = time.perf_counter()
+            await asyncio.gather(*(post(i) for i in range(updates)))
+            await done.wait()
+            elapsed = time.perf_counter() - started
+
+        await server.stop()
+        await application.stop()
+    await api.stop()
+
+    latencies.sort()
+    print(f'апдейтов: {updates}, пользователей: {users}, обработчик: {work_ms} мс')
+    print(f'пропускная способность: {updates / elapsed:.0f} апдейтов/с')
+    print(f'задержка p50: {statistics.median(latencies) * 1000:.1f} мс, '
+          f'p99: {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} мс')
+    print(f'нарушений порядка внутри пользователя: {out_of_order}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Задержка и пропускная способность webhook-режима')
+    parser.add_argument('--updates', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=50, help='одновременных POST-запросов')
+    parser.add_argument('--work-ms', type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.updates, args.users, args.concurrency, args.work_ms))
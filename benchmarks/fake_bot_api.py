@@ -0,0 +1,154 @@
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Iron Discipline', 'username': 'fake_discipline_bot'}
+
+
+class FakeBotAPI:
+    # Локальная замена Bot API для нагрузочных тестов. Записывает вызовы и умеет
+    # добавлять задержку, отвечать 429 (RetryAfter) и 403 «бот заблокирован».
+    # Бот направляется сюда через base_url=f'{fake.base_url}/bot'.
+    def __init__(self, host='127.0.0.1', port=18081, latency_ms=0.0, jitter_ms=0.0,
+                 flood_rate=0.0, retry_after=1, blocked_rate=0.0, blocked_chats=(), seed=0):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.blocked_rate = blocked_rate
+        self.blocked_chats = set(blocked_chats)
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.errors = Counter()
+        self.messages_by_chat = Counter()
+        # Последняя inline-клавиатура в каждом чате: по ней нагрузочный прогон «нажимает» кнопки
+        self.keyboards = {}
+        self.started_at = None
+        self._message_id = 0
+        self._runner = None
+
+        self.web_app = web.Application()
+        self.web_app.router.add_route('*', '/bot{token}/{method}', self.handle)
+
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.port}'
+
+    async def start(self):
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.started_at = time.perf_counter()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def reset(self):
+        self.calls.clear()
+        self.errors.clear()
+        self.messages_by_chat.clear()
+        self.started_at = time.perf_counter()
+
+    def _message(self, chat_id, text=None, message_id=None, reply_markup=None):
+        if message_id is None:
+            self._message_id += 1
+            message_id = self._message_id
+        message = {
+            'message_id': int(message_id),
+            'date': int(time.time()),
+            'chat': {'id': int(chat_id), 'type': 'private'},
+            'from': BOT_USER,
+            'text': text or '',
+        }
+        # В сообщении Telegram возвращает только inline-клавиатуру
+        if reply_markup and 'inline_keyboard' in json.loads(reply_markup):
+            message['reply_markup'] = json.loads(reply_markup)
+            self.keyboards[int(chat_id)] = message['reply_markup']['inline_keyboard']
+        return message
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = dict(await request.post())
+        self.calls[method] += 1
+
+        delay = self.latency_ms + self.random.uniform(0, self.jitter_ms)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+
+        chat_id = params.get('chat_id')
+        if method == 'sendMessage':
+            if int(chat_id) in self.blocked_chats or self.random.random() < self.blocked_rate:
+                self.errors['blocked'] += 1
+                return web.json_response(
+                    {'ok': False, 'error_code': 403, 'description': 'Forbidden: bot was blocked by the user'},
+                    status=403,
+                )
+            if self.random.random() < self.flood_rate:
+                self.errors['flood'] += 1
+                return web.json_response({
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f'Too Many Requests: retry after {self.retry_after}',
+                    'parameters': {'retry_after': self.retry_after},
+                }, status=429)
+            self.messages_by_chat[int(chat_id)] += 1
+
+        if method == 'getMe':
+            result = BOT_USER
+        elif method == 'sendMessage':
+            result = self._message(chat_id, params.get('text'), reply_markup=params.get('reply_markup'))
+        elif method in ('editMessageText', 'editMessageReplyMarkup') and chat_id:
+            result = self._message(chat_id, params.get('text'), params.get('message_id'), params.get('reply_markup'))
+        elif method == 'getUpdates':
+            result = []
+        else:
+            result = True
+        return web.json_response({'ok': True, 'result': result})
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0
+        sent = self.calls['sendMessage'] - self.errors['blocked'] - self.errors['flood']
+        return {
+            'calls': dict(self.calls),
+            'errors': dict(self.errors),
+            'messages_sent': sent,
+            'messages_per_second': sent / elapsed if elapsed else 0.0,
+        }
+
+
+async def _serve(args):
+    api = FakeBotAPI(args.host, args.port, args.latency_ms, args.jitter_ms, args.flood_rate,
+                     args.retry_after, args.blocked_rate)
+    await api.start()
+    print(f'Фейковый Bot API слушает {api.base_url}/bot<token>/<method>')
+    try:
+        while True:
+            await asyncio.sleep(10)
+            print(api.report())
+    finally:
+        await api.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Локальная замена Telegram Bot API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18081)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--flood-rate', type=float, default=0.0, help='доля sendMessage с ответом 429')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--blocked-rate', type=float, default=0.0, help='доля sendMessage с ответом 403')
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,146 @@
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+
+from telegram import Update
+
+import synthetic  # noqa: F401  (путь к модулям бота)
+from fake_bot_api import BOT_USER, FakeBotAPI
+from bot_moti import HabitTrackerBot
+
+TOKEN = '123456:load-test'
+_update_ids = itertools.count(1)
+
+
+def _user(user_id):
+    return {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+
+
+def message_update(user_id, text):
+    message = {
+        'message_id': next(_update_ids),
+        'date': int(time.time()),
+        'chat': {'id': user_id, 'type': 'private'},
+        'from': _user(user_id),
+        'text': text,
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'update_id': next(_update_ids), 'message': message}
+
+
+def callback_update(user_id, data):
+    return {
+        'update_id': next(_update_ids),
+        'callback_query': {
+            'id': str(next(_update_ids)),
+            'from': _user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': next(_update_ids),
+                'date': int(time.time()),
+                'chat': {'id': user_id, 'type': 'private'},
+                'from': BOT_USER,
+                'text': 'menu',
+            },
+        },
+    }
+
+
+def first_button(api, user_id):
+    # callback_data первой кнопки последней клавиатуры в чате — как нажатие пользователя
+    return api.keyboards[user_id][0][0]['callback_data']
+
+
+# Полный путь пользователя: старт, меню, добавление, частота, отметка, прогресс, история, мотивация, удаление.
+# Привычка выбирается кнопкой из списка, который бот прислал на предыдущем шаге.
+def user_flow(user_id):
+    habit = f'Привычка {user_id}'
+    return [
+        ('start', message_update, '/start'),
+        ('main_menu', callback_update, 'main_menu'),
+        ('add_habit', callback_update, 'add_habit'),
+        ('habit_name', message_update, habit),
+        ('set_frequency', message_update, 'Ежедневно'),
+        ('complete_list', callback_update, 'complete_habit'),
+        ('complete_habit', callback_update, first_button),
+        ('progress', callback_update, 'progress'),
+        ('history', callback_update, 'history'),
+        ('motivation', callback_update, 'motivation'),
+        ('delete_list', callback_update, 'delete_habit'),
+        ('delete_habit', callback_update, first_button),
+    ]
+
+
+async def run_user(bot, api, user_id, latencies):
+    for step, build, payload in user_flow(user_id):
+        if callable(payload):
+            payload = payload(api, user_id)
+        update = Update.de_json(build(user_id, payload), bot.app.bot)
+        started = time.perf_counter()
+        await bot.app.process_update(update)
+        latencies[step].append(time.perf_counter() - started)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def main(args):
+    api = FakeBotAPI(port=args.api_port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                     flood_rate=args.flood_rate, blocked_rate=args.blocked_rate)
+    await api.start()
+    latencies = defaultdict(list)
+    with tempfile.TemporaryDirectory() as tmp:
+        bot = HabitTrackerBot(TOKEN, db_path=os.path.join(tmp, 'load.db'), base_url=f'{api.base_url}/bot')
+        async with bot.app:
+            await bot.lifecycle.startup()
+            await bot.app.start()
+            api.reset()
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def limited(user_id):
+                async with semaphore:
+                    await run_user(bot, api, user_id, latencies)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(limited(user_id) for user_id in range(1, args.users + 1)))
+            elapsed = time.perf_counter() - started
+            await bot.app.stop()
+            await bot.lifecycle.drain()
+            cache_stats = bot.repository.cache.stats()
+        await bot.lifecycle.shutdown()
+    await api.stop()
+
+    total = sum(len(values) for values in latencies.values())
+    print(f'пользователей: {args.users}, апдейтов: {total}, время: {elapsed:.2f} с, '
+          f'{total / elapsed:.0f} апдейтов/с')
+    print(f"{'шаг':<16} {'p50, мс':>9} {'p99, мс':>9}")
+    for step, values in latencies.items():
+        print(f'{step:<16} {statistics.median(values) * 1000:>9.2f} {percentile(values, 0.99) * 1000:>9.2f}')
+    every = [value for values in latencies.values() for value in values]
+    print(f"{'все':<16} {statistics.median(every) * 1000:>9.2f} {percentile(every, 0.99) * 1000:>9.2f}")
+    print('Bot API:', api.report())
+    for kind, hits in cache_stats['hits'].items():
+        lookups = hits + cache_stats['misses'][kind]
+        ratio = f'{hits / lookups:.0%}' if lookups else '—'
+        print(f'кэш {kind}: попаданий {hits} из {lookups} ({ratio})')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон HabitTrackerBot против фейкового Bot API')
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=100, help='одновременно активных пользователей')
+    parser.add_argument('--api-port', type=int, default=18081)
+    parser.add_argument('--latency-ms', type=float, default=20.0)
+    parser.add_argument('--jitter-ms', type=float, default=10.0)
+    parser.add_argument('--flood-rate', type=float, default=0.0)
+    parser.add_argument('--blocked-rate', type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
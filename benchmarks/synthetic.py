@@ -0,0 +1,60 @@
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+# Бенчмарки запускаются из корня репозитория: python benchmarks/<script>.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import migrate
+
+FREQUENCIES = ('Ежедневно', 'Еженедельно', 'Ежемесячно')
+
+# Таблица в том виде, в каком её создавали версии бота до миграций
+HABITS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS habits (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        habit_name TEXT,
+        frequency TEXT,
+        progress INTEGER DEFAULT 0,
+        total INTEGER,
+        start_date TEXT,
+        archived INTEGER DEFAULT 0,
+        is_blocked INTEGER DEFAULT 0
+    )
+'''
+
+
+def create_habits_db(path, habit_count, habits_per_user=5, seed=42, migrated=True):
+    # Синтетическая база: habit_count привычек, в среднем habits_per_user на пользователя.
+    # Строки вставляются в старую схему, затем (если migrated) применяются миграции с индексами.
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    rng = random.Random(seed)
+    today = datetime.now()
+    conn = sqlite3.connect(path)
+    conn.execute(HABITS_SCHEMA)
+
+    def rows():
+        for i in range(habit_count):
+            start = today - timedelta(days=rng.randint(0, 60))
+            yield (
+                i // habits_per_user + 1,
+                f'habit-{i}',
+                rng.choice(FREQUENCIES),
+                rng.randint(0, 29),
+                30,
+                start.strftime('%Y-%m-%d'),
+            )
+
+    conn.executemany(
+        'INSERT INTO habits (user_id, habit_name, frequency, progress, total, start_date) VALUES (?, ?, ?, ?, ?, ?)',
+        rows(),
+    )
+    conn.commit()
+    conn.close()
+    if migrated:
+        migrate(path)
@@ -1,31 +1,84 @@
-import aiosqlite
 import asyncio
+import functools
+import os
+import signal
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from telegram.error import BadRequest
 from telegram.ext import (
     Application, CommandHandler, CallbackContext, ConversationHandler, MessageHandler,
-    CallbackQueryHandler, filters
+    CallbackQueryHandler, TypeHandler, filters
 )
-import sqlite3
-from datetime import datetime
-import random
-from apscheduler.schedulers.background import BackgroundScheduler
-import motivations
+from datetime import date, datetime
+from metrics import REGISTRY, LoopLagMonitor, track_handler
 from scheduler_tasks import SchedulerTasks
+from callback_data import COMPLETE, COMPLETE_PAGE, DELETE, DELETE_PAGE, HABIT_ACTIONS, NOOP, pack, unpack
+from habit_repository import EVENT_DELETE, HISTORY_PAGE_SIZE, HabitRepository, DB_PATH
+from lifecycle import Lifecycle
+from migrations import migrate
+from progress import PROGRESS_STORED
+from quote_store import QuoteStore, permute
+from reminder_dispatcher import GLOBAL_RATE
+from reminder_slots import validate_timezone
+from sharding import ShardMap, init_shard, shard_for
+from sqlite_persistence import CONVERSATION_TTL, SQLitePersistence
+from streaks import current_streak
+from update_processor import CONCURRENT_UPDATES, PerUserUpdateProcessor
 import logging
 
+# CONFIRMING_COMPLETION и DELETING_HABIT остались от ввода названия текстом:
+# в них могут быть сохранённые диалоги
 ADDING_HABIT, SETTING_FREQUENCY, CONFIRMING_COMPLETION, DELETING_HABIT = range(4)
+HABITS_PAGE_SIZE = 8
 
 class HabitTrackerBot:
-    def __init__(self, token):
+    def __init__(self, token, progress_mode=PROGRESS_STORED, concurrent_updates=CONCURRENT_UPDATES,
+                 db_path=DB_PATH, base_url=None, metrics_port=None, metrics_host=None, profiling=False,
+                 reminder_rate=GLOBAL_RATE, quotes_path=None, shard=None, run_scheduler=True,
+                 shard_map_path=None):
+        # Запуск и остановка — через Lifecycle, подключённый к хукам Application
+        self.lifecycle = Lifecycle(self)
         self.token = token
-        self.app = Application.builder().token(self.token).build()
-        self._init_db()
-        self._add_archived_column()
-        self._add_blocked_column()
-        
-        # Инициализируем планировщик
-        self.scheduler_tasks = SchedulerTasks(self.app.bot)
-        self.scheduler_tasks.start()
+        self.metrics_port = metrics_port
+        self.metrics_host = metrics_host
+        self.profiling = profiling
+        # Несколько воркеров на одной базе: напоминания и тик прогресса запускает только один
+        self.run_scheduler = run_scheduler
+        # Воркер шарда перечитывает карту шардов при reload: делит лимит рассылки
+        # и подхватывает состояние пользователей, переехавших в его шард
+        self.shard = shard
+        self.shard_map_path = shard_map_path
+        self.shard_count = ShardMap.load(shard_map_path).count if shard_map_path else None
+        self._reload_task = None
+        self.metrics_server = None
+        self.loop_lag_monitor = None
+
+        # Общий пул соединений для обработчиков, планировщика и хранения диалогов.
+        # Схема готовится один раз при открытии пула: миграции, а у шарда ещё и диапазон id.
+        setup = migrate if shard is None else functools.partial(init_shard, shard=shard)
+        self.repository = HabitRepository(db_path, progress_mode=progress_mode, setup=setup)
+        # Корпус цитат загружается при запуске; до этого — встроенный список
+        self.quotes = QuoteStore(quotes_path)
+        self._quotes_reload = None
+
+        # Апдейты разных пользователей обрабатываются параллельно, одного — по порядку.
+        # Состояние диалогов хранится в базе и переживает перезапуск.
+        builder = (
+            Application.builder()
+            .token(self.token)
+            .concurrent_updates(PerUserUpdateProcessor(concurrent_updates))
+            .persistence(SQLitePersistence(self.repository))
+            .post_init(self.lifecycle.startup)
+            .post_stop(self.lifecycle.drain)
+            .post_shutdown(self.lifecycle.shutdown)
+        )
+        if base_url:
+            # Локальный Bot API сервер или заглушка для нагрузочных тестов
+            builder = builder.base_url(base_url)
+        self.app = builder.build()
+
+        # Инициализируем планировщик; запускается он в Lifecycle.startup, когда цикл событий уже работает
+        self.scheduler_tasks = SchedulerTasks(self.app.bot, self.repository, reminder_rate)
 
 
         # Добавляем обработчики команд и состояний
@@ -38,12 +91,21 @@ class HabitTrackerBot:
                 ADDING_HABIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.add_habit)],
                 SETTING_FREQUENCY: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.set_frequency)],
                 CONFIRMING_COMPLETION: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.complete_habit)],
-                DELETING_HABIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.delete_habit)]
+                DELETING_HABIT: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.delete_habit)],
+                ConversationHandler.TIMEOUT: [TypeHandler(Update, self.conversation_timeout)],
             },
-            fallbacks=[CommandHandler('start', self.start)]
+            # Кнопки работают и посреди диалога, например в ожидании названия привычки
+            fallbacks=[CommandHandler('start', self.start), CallbackQueryHandler(self.button_handler)],
+            # Брошенный диалог завершается через тот же срок, что и в базе: иначе в памяти
+            # он жил бы до перезапуска. Таймеры ведёт JobQueue приложения
+            conversation_timeout=CONVERSATION_TTL,
+            name='habit_conversation',
+            persistent=True
         )
 
         self.app.add_handler(self.conv_handler)
+        self.app.add_handler(CommandHandler('remind', self.set_reminder_time))
+        self.app.add_handler(CommandHandler('motivation', self.motivation_command))
         
                 
         
@@ -52,47 +114,10 @@ class HabitTrackerBot:
 
 
         
-    def _init_db(self):
-        conn = sqlite3.connect('grim_hustle.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS habits (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                habit_name TEXT,
-                frequency TEXT,
-                progress INTEGER DEFAULT 0,
-                total INTEGER,
-                start_date TEXT,
-                archived INTEGER DEFAULT 0
-            )
-        ''')
-        conn.commit()
-        conn.close()
-        pass
-        
-    def _add_archived_column(self):
-        conn = sqlite3.connect('grim_hustle.db')
-        cursor = conn.cursor()
-        try:
-            cursor.execute('ALTER TABLE habits ADD COLUMN archived INTEGER DEFAULT 0')
-        except sqlite3.OperationalError:
-            pass
-        conn.commit()
-        conn.close()
-        pass
-    
-    def _add_blocked_column(self):
-        conn = sqlite3.connect('grim_hustle.db')
-        cursor = conn.cursor()
-        try:
-            cursor.execute('ALTER TABLE habits ADD COLUMN is_blocked INTEGER DEFAULT 0')
-        except sqlite3.OperationalError:
-            pass  # Если колонка уже существует, просто пропускаем
-        conn.commit()
-        conn.close()
-
+    @track_handler
     async def start(self, update: Update, context: CallbackContext):
+        # Пользователь снова пишет боту — значит, напоминания ему можно отправлять
+        await self.repository.unblock_user(update.effective_user.id)
         keyboard = [[InlineKeyboardButton("Перейти в меню", callback_data='main_menu')]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         if update.message:
@@ -112,23 +137,38 @@ class HabitTrackerBot:
     async def send_main_menu(self, update: Update):
         keyboard = [
             [InlineKeyboardButton("Добавить привычку", callback_data='add_habit')],
+            [InlineKeyboardButton("Отметить выполнение", callback_data='complete_habit')],
             [InlineKeyboardButton("Показать прогресс", callback_data='progress')],
             [InlineKeyboardButton("Получить мотивацию", callback_data='motivation')],
+            [InlineKeyboardButton("📜 История", callback_data='history')],
             [InlineKeyboardButton("Удалить привычку", callback_data='delete_habit')]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.callback_query.message.edit_text(
             "Ты готов улучшить себя? Отлично! Вот что мы можем сделать вместе:\n\n"
             "🌱 Добавить привычку: Напиши свою новую цель, выбери, как часто будешь её выполнять, и мы начнём путь!\n\n"
+            "✅ Отметить выполнение: Выбери привычку из списка — прогресс вырастет сразу.\n\n"
             "🚀 Показать прогресс: Загляни в свои достижения и посмотри, как продвигаешься. Каждый шаг — это маленькая победа!\n\n"
             "💪 Получить мотивацию: Иногда нужно немного силы и вдохновения. Получи фразу, которая поднимет боевой дух!\n\n"
+            "📜 История: Все твои отметки — от последней к первой.\n\n"
             "🎯 Удалить привычку: Как только ты освоил привычку — можно удалить её.\n\n"
             "Выбирай цель, ставь план и побеждай себя каждый день! 🌟",
             reply_markup=reply_markup
         )
 
+    @track_handler
     async def button_handler(self, update: Update, context: CallbackContext):
         query = update.callback_query
+        if query.data == NOOP:
+            # Состояние диалога не меняем
+            await query.answer()
+            return None
+        if query.data.startswith('done:'):
+            await self.complete_habit_from_reminder(update, context)
+            return ConversationHandler.END
+        if query.data.split(':', 1)[0] in HABIT_ACTIONS:
+            await self.pick_habit(update, context)
+            return ConversationHandler.END
         await query.answer()
 
         if query.data == 'main_menu':
@@ -143,13 +183,16 @@ class HabitTrackerBot:
         elif query.data == 'motivation':
             await self.send_motivation(update, context)
             return ConversationHandler.END
-        elif query.data == 'complete_habit':
-            await query.edit_message_text("Введите название привычки, для увеличения её прогресса:")
-            return CONFIRMING_COMPLETION
-        elif query.data == 'delete_habit':
-            await query.edit_message_text("Введите название привычки, которую хотите удалить:")
-            return DELETING_HABIT
+        elif query.data == 'history' or query.data.startswith('history:'):
+            await self.show_history(update, context)
+            return ConversationHandler.END
+        elif query.data in ('complete_habit', 'delete_habit'):
+            action = COMPLETE if query.data == 'complete_habit' else DELETE
+            text, reply_markup = await self.habit_picker(query.from_user.id, action)
+            await query.edit_message_text(text, reply_markup=reply_markup)
+            return ConversationHandler.END
 
+    @track_handler
     async def add_habit(self, update: Update, context: CallbackContext):
         habit_name = update.message.text
         context.user_data['habit_name'] = habit_name
@@ -163,120 +206,255 @@ class HabitTrackerBot:
         await update.message.reply_text("Как часто вы хотите выполнять эту привычку?", reply_markup=reply_markup)
         return SETTING_FREQUENCY
 
+    @track_handler
     async def set_frequency(self, update: Update, context: CallbackContext):
         frequency = update.message.text
         habit_name = context.user_data.get('habit_name')
         user_id = update.message.from_user.id
+        if habit_name is None:
+            # Состояние диалога сохранилось, а название — нет (например, после сбоя)
+            await update.message.reply_text("Введите название привычки:")
+            return ADDING_HABIT
 
-        conn = sqlite3.connect('grim_hustle.db')
-        cursor = conn.cursor()
-        cursor.execute('INSERT INTO habits (user_id, habit_name, frequency, total, start_date) VALUES (?, ?, ?, ?, ?)',
-                      (user_id, habit_name, frequency, 30, datetime.now().strftime('%Y-%m-%d')))
-        conn.commit()
-        conn.close()
+        await self.repository.add_habit(user_id, habit_name, frequency)
+        context.user_data.pop('habit_name', None)
 
         await update.message.reply_text(f"Привычка '{habit_name}' добавлена с частотой '{frequency}'. Удачи!")
         keyboard = [[InlineKeyboardButton("Вернуться в меню", callback_data='main_menu')]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text("Вы можете вернуться в главное меню и продолжить отслеживание!", reply_markup=reply_markup)
         return ConversationHandler.END
-    
-    async def complete_habit(self, update: Update, context: CallbackContext):
-         # Получаем название привычки, чтобы увеличить прогресс
-        habit_name = update.message.text
-        user_id = update.message.from_user.id
-
-        # Подключаемся к базе данных
-        conn = sqlite3.connect('grim_hustle.db')
-        cursor = conn.cursor()
-
-        # Проверяем, есть ли такая привычка у пользователя
-        cursor.execute('SELECT id, progress, total FROM habits WHERE user_id = ? AND habit_name = ? AND archived = 0', 
-                   (user_id, habit_name))
-        habit = cursor.fetchone()
 
-        if habit:
-            habit_id, progress, total = habit
-            new_progress = progress + 10  # Увеличиваем прогресс на 10 (это можно настроить)
+    async def conversation_timeout(self, update: Update, context: CallbackContext):
+        # Введённое название брошенной привычки больше не нужно
+        context.user_data.pop('habit_name', None)
 
-            # Если прогресс достиг или превысил цель, архивируем привычку
-            if new_progress >= total:
-                cursor.execute('UPDATE habits SET progress = ?, archived = 1 WHERE id = ?', (total, habit_id))
-                message = f"Поздравляем! Вы завершили привычку '{habit_name}' и она теперь будет перемещена в архив."
+    @track_handler
+    async def pick_habit(self, update: Update, context: CallbackContext):
+        # Кнопки списка привычек: страница списка, отметка или удаление по id
+        query = update.callback_query
+        try:
+            action, values = unpack(query.data)
+            if action in (COMPLETE, DELETE):
+                habit_id, page = values
             else:
-                cursor.execute('UPDATE habits SET progress = ? WHERE id = ?', (new_progress, habit_id))
-                message = f"Прогресс для привычки '{habit_name}' увеличен на 10. Теперь ваш прогресс: {new_progress}/{total}."
+                (page,) = values
+        except ValueError:
+            await query.answer("Кнопка устарела, откройте список заново.")
+            return
+        await query.answer()
 
-            conn.commit()
+        notice = None
+        if action == COMPLETE:
+            completion = await self.repository.complete_habit_by_id(query.from_user.id, habit_id)
+            notice = self.completion_message(completion)
+        elif action == DELETE:
+            habit_name = await self.repository.delete_habit_by_id(query.from_user.id, habit_id)
+            notice = f"Привычка '{habit_name}' успешно удалена." if habit_name else "Привычка не найдена."
+        text, reply_markup = await self.habit_picker(
+            query.from_user.id, COMPLETE if action in (COMPLETE, COMPLETE_PAGE) else DELETE, page, notice
+        )
+        try:
+            await query.edit_message_text(text, reply_markup=reply_markup)
+        except BadRequest as e:
+            # Устаревшая стрелка могла привести к уже показанной странице (список стал короче)
+            if 'not modified' not in e.message:
+                raise
+
+    async def habit_picker(self, user_id, action, page=0, notice=None):
+        # Текст и клавиатура со страницей активных привычек; в кнопках — id, а не название
+        habits = await self.repository.list_habits(user_id)
+        menu_row = [InlineKeyboardButton("Вернуться в меню", callback_data='main_menu')]
+        lines = [notice] if notice else []
+        if not habits:
+            lines.append("У вас пока нет активных привычек. Начните с добавления новой привычки!")
+            return "\n\n".join(lines), InlineKeyboardMarkup([menu_row])
+
+        pages = (len(habits) - 1) // HABITS_PAGE_SIZE + 1
+        page = min(max(page, 0), pages - 1)
+        if action == COMPLETE:
+            lines.append("Выберите привычку, чтобы отметить выполнение:")
+            page_action = COMPLETE_PAGE
         else:
-            message = "Привычка не найдена или уже завершена."
-
-        conn.close()
-
-        # Отправляем сообщение пользователю
-        await update.message.reply_text(message)
-
-        # Возвращаем пользователя в главное меню
-        keyboard = [[InlineKeyboardButton("Вернуться в меню", callback_data='main_menu')]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text("Вы можете вернуться в главное меню.", reply_markup=reply_markup)
-    
+            lines.append("Выберите привычку, которую хотите удалить:")
+            page_action = DELETE_PAGE
+        keyboard = []
+        for habit in habits[page * HABITS_PAGE_SIZE:(page + 1) * HABITS_PAGE_SIZE]:
+            if action == COMPLETE:
+                label = f"✅ {habit.habit_name} — {habit.progress:.0f}/{habit.total}"
+            else:
+                label = f"🗑 {habit.habit_name}"
+            keyboard.append([InlineKeyboardButton(label, callback_data=pack(action, habit.id, page))])
+        if pages > 1:
+            navigation = []
+            if page > 0:
+                navigation.append(InlineKeyboardButton("⬅️", callback_data=pack(page_action, page - 1)))
+            navigation.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data=NOOP))
+            if page < pages - 1:
+                navigation.append(InlineKeyboardButton("➡️", callback_data=pack(page_action, page + 1)))
+            keyboard.append(navigation)
+        keyboard.append(menu_row)
+        return "\n\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+    def completion_message(self, completion):
+        if completion is None:
+            return "Привычка не найдена или уже завершена."
+        if completion.archived:
+            return f"Поздравляем! Вы завершили привычку '{completion.habit_name}' и она теперь будет перемещена в архив."
+        message = (f"Прогресс для привычки '{completion.habit_name}' увеличен на 10. "
+                   f"Теперь ваш прогресс: {completion.progress:.0f}/{completion.total}.")
+        if completion.streak > 1:
+            message += f" 🔥 Серия: {completion.streak}."
+        return message
+
+    @track_handler
+    async def complete_habit(self, update: Update, context: CallbackContext):
+        # Диалоги, сохранённые до перехода на кнопки, ждут название текстом:
+        # вместо поиска по названию показываем список
+        text, reply_markup = await self.habit_picker(update.message.from_user.id, COMPLETE)
+        await update.message.reply_text(text, reply_markup=reply_markup)
         return ConversationHandler.END
-    
-    async def delete_habit(self, update: Update, context: CallbackContext):
-        # Получаем название привычки, которую нужно удалить, от пользователя
-        habit_name = update.message.text
-        user_id = update.message.from_user.id
-
-        # Удаляем привычку из базы данных
-        conn = sqlite3.connect('grim_hustle.db')
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM habits WHERE user_id = ? AND habit_name = ?', (user_id, habit_name))
-        conn.commit()
-        conn.close()
 
-        # Сообщаем пользователю, что привычка успешно удалена
-        await update.message.reply_text(f"Привычка '{habit_name}' успешно удалена.")
-        
-        # Предлагаем пользователю вернуться в меню
-        keyboard = [[InlineKeyboardButton("Вернуться в меню", callback_data='main_menu')]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text("Вы можете вернуться в главное меню и продолжить отслеживание!", reply_markup=reply_markup)
-        
+    @track_handler
+    async def delete_habit(self, update: Update, context: CallbackContext):
+        text, reply_markup = await self.habit_picker(update.message.from_user.id, DELETE)
+        await update.message.reply_text(text, reply_markup=reply_markup)
         return ConversationHandler.END
 
+    @track_handler
+    async def complete_habit_from_reminder(self, update: Update, context: CallbackContext):
+        # Отметка привычки кнопкой из напоминания, без ввода названия
+        query = update.callback_query
+        try:
+            _, habit_id = query.data.split(':', 1)
+            habit_id = int(habit_id)
+        except ValueError:
+            await query.answer("Кнопка устарела, откройте список заново.")
+            return
+        completion = await self.repository.complete_habit_by_id(query.from_user.id, habit_id)
+
+        if completion is None:
+            await query.answer("Привычка не найдена или уже завершена.")
+        elif completion.archived:
+            await query.answer(f"Поздравляем! Привычка '{completion.habit_name}' завершена и перемещена в архив.")
+        else:
+            await query.answer(f"Прогресс '{completion.habit_name}': {completion.progress:.1f}/{completion.total}. "
+                               f"Серия: {completion.streak}.")
+
+        # Убираем отмеченную кнопку из напоминания
+        reply_markup = getattr(query.message, 'reply_markup', None)
+        if reply_markup:
+            keyboard = [row for row in reply_markup.inline_keyboard if row[0].callback_data != query.data]
+            await query.edit_message_reply_markup(InlineKeyboardMarkup(keyboard) if keyboard else None)
 
+    @track_handler
     async def check_progress(self, update: Update, context: CallbackContext):
         query = update.callback_query
         user_id = query.from_user.id
 
-        conn = sqlite3.connect('grim_hustle.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT habit_name, progress, total FROM habits WHERE user_id = ? AND archived = 0', (user_id,))
-        habits = cursor.fetchall()
-        conn.close()
-
-        if not habits:
-            message = "У вас пока нет активных привычек. Начните с добавления новой привычки!"
+        # Повторные нажатия отдают готовый текст из кэша. В ленивом режиме прогресс
+        # растёт каждый час, поэтому текст кэшируется в пределах текущего часа;
+        # в обычном режиме — в пределах дня, за который может прерваться серия.
+        cache = self.repository.cache
+        if self.repository.lazy:
+            cache_key = ('progress', int(time.time() // 3600))
         else:
-            message = "Ваш прогресс:\n\n"
-            for habit in habits:
-                name, progress, total = habit
-                percentage = (progress / total) * 100 if total > 0 else 0
-                message += f"🎯 {name}: {progress}/{total} ({percentage:.1f}%)\n"
+            cache_key = ('progress', date.today().toordinal())
+        message = cache.get_rendered(user_id, cache_key)
+        if message is None:
+            generation = cache.generation(user_id)
+            habits = await self.repository.list_habits(user_id)
+
+            if not habits:
+                message = "У вас пока нет активных привычек. Начните с добавления новой привычки!"
+            else:
+                message = "Ваш прогресс:\n\n"
+                for habit in habits:
+                    percentage = (habit.progress / habit.total) * 100 if habit.total > 0 else 0
+                    message += f"🎯 {habit.habit_name}: {habit.progress}/{habit.total} ({percentage:.1f}%)"
+                    streak = current_streak(habit.frequency, habit.streak, habit.last_completed_at)
+                    if streak:
+                        message += f" 🔥 {streak}"
+                    message += "\n"
+            cache.put_rendered(user_id, cache_key, message, generation)
 
         keyboard = [[InlineKeyboardButton("Вернуться в меню", callback_data='main_menu')]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.edit_message_text(message, reply_markup=reply_markup)
 
+    @track_handler
+    async def show_history(self, update: Update, context: CallbackContext):
+        # Страница истории; «Раньше» передаёт id последнего показанного события
+        query = update.callback_query
+        try:
+            before_id = int(query.data.split(':', 1)[1]) if ':' in query.data else None
+        except ValueError:
+            await query.answer("Кнопка устарела, откройте список заново.")
+            return
+        events = await self.repository.list_history(query.from_user.id, before_id)
+
+        if not events:
+            message = "История пока пуста. Отметьте привычку, и она появится здесь!" if before_id is None \
+                else "Более ранних событий нет."
+        else:
+            message = "📜 История:\n\n"
+            for event in events:
+                moment = datetime.fromtimestamp(event.created_at).strftime('%d.%m.%Y %H:%M')
+                if event.kind == EVENT_DELETE:
+                    message += f"🗑 {moment} — '{event.habit_name}' удалена\n"
+                else:
+                    message += f"✅ {moment} — '{event.habit_name}' +{event.amount:g}, прогресс {event.progress:g}\n"
+
+        keyboard = []
+        if len(events) == HISTORY_PAGE_SIZE:
+            keyboard.append([InlineKeyboardButton("⬅️ Раньше", callback_data=f'history:{events[-1].id}')])
+        keyboard.append([InlineKeyboardButton("Вернуться в меню", callback_data='main_menu')])
+        await query.edit_message_text(message, reply_markup=InlineKeyboardMarkup(keyboard))
+
+    @track_handler
+    async def set_reminder_time(self, update: Update, context: CallbackContext):
+        # /remind <час> [часовой пояс], например: /remind 8 Europe/Moscow
+        args = context.args
+        if not args or not args[0].isdigit() or not 0 <= int(args[0]) <= 23 or len(args) > 2:
+            await update.message.reply_text(
+                "Укажите час напоминаний от 0 до 23 и, при желании, часовой пояс. Например: /remind 8 Europe/Moscow"
+            )
+            return
+        timezone = args[1] if len(args) == 2 else None
+        if timezone and not validate_timezone(timezone):
+            await update.message.reply_text(f"Не знаю часовой пояс '{timezone}'. Пример: Europe/Moscow")
+            return
+
+        await self.repository.set_reminder_slot(update.effective_user.id, timezone, int(args[0]))
+        await update.message.reply_text(f"Готово! Напоминания будут приходить около {int(args[0])}:00.")
+
+    @track_handler
     async def send_motivation(self, update: Update, context: CallbackContext):
-        motivational_quotes = motivations.motivations_list
         query = update.callback_query
-        quote = random.choice(motivational_quotes)
+        quote = await self.next_quote(query.from_user)
         keyboard = [[InlineKeyboardButton("Вернуться в меню", callback_data='main_menu')]]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await query.edit_message_text(f"💪 {quote}", reply_markup=reply_markup)
-        
+        await query.edit_message_text(f"💪 {quote or 'Цитаты пока не загружены.'}", reply_markup=reply_markup)
+
+    @track_handler
+    async def motivation_command(self, update: Update, context: CallbackContext):
+        # /motivation [тег], например: /motivation спорт
+        tag = ' '.join(context.args).strip().lower() or None
+        quote = await self.next_quote(update.effective_user, tag)
+        if quote is None:
+            await update.message.reply_text(f"Не нашёл цитат с тегом '{tag}'." if tag else "Цитаты пока не загружены.")
+            return
+        await update.message.reply_text(f"💪 {quote}")
+
+    async def next_quote(self, user, tag=None):
+        # Следующая цитата в личной перестановке пула: без повторов, пока пул не исчерпан
+        lang = (user.language_code or '')[:2].lower() or None
+        index, pool, numbers = self.quotes.select(lang, tag)
+        if not numbers:
+            return None
+        seed, cursor = await self.repository.next_quote_position(user.id, pool, len(numbers))
+        return index.text(numbers[permute(cursor, len(numbers), seed)])
+
     def should_send_reminder(self, frequency):
         now = datetime.now()
         
@@ -290,11 +468,139 @@ class HabitTrackerBot:
 
 
     
+    async def start_observability(self, application=None):
+        # Задержка цикла событий меряется всегда, HTTP /metrics — только если задан порт
+        self.loop_lag_monitor = LoopLagMonitor()
+        self.loop_lag_monitor.start()
+        REGISTRY.add_collector(self.repository.cache.collect)
+        if self.metrics_port:
+            # aiohttp нужен только для эндпоинта метрик
+            from metrics_server import METRICS_HOST, MetricsServer
+            from profiler import SamplingProfiler
+
+            self.metrics_server = MetricsServer(
+                self.metrics_host or METRICS_HOST, self.metrics_port,
+                profiler=SamplingProfiler() if self.profiling else None,
+            )
+            await self.metrics_server.start()
+
+    async def stop_observability(self, application=None):
+        REGISTRY.remove_collector(self.repository.cache.collect)
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+            self.metrics_server = None
+        if self.loop_lag_monitor is not None:
+            await self.loop_lag_monitor.stop()
+            self.loop_lag_monitor = None
+
     def run(self):
         print("Бот запущен!")
         self.app.run_polling()
 
+    def run_webhook(self, webhook_url, host='0.0.0.0', port=8443, secret_token=None):
+        print("Бот запущен в режиме webhook!")
+        asyncio.run(self._serve_webhook(webhook_url, host, port, secret_token))
+
+    def run_shard_worker(self, host, port, secret_token):
+        # Воркер шарда: апдейты приходят от shard_router.py, webhook регистрирует роутер
+        print(f"Воркер шарда запущен на {host}:{port}")
+        asyncio.run(self._serve_webhook(None, host, port, secret_token, on_reload=self.reload))
+
+    def on_sighup(self):
+        self._reload_task = asyncio.get_running_loop().create_task(self.reload())
+
+    async def reload(self):
+        # SIGHUP или /reload от супервизора шардов после перебалансировки
+        self.repository.cache.clear()
+        if self.shard_map_path:
+            shard_map = ShardMap.load(self.shard_map_path)
+            # Все воркеры шардов вместе не превышают общий лимит Telegram
+            self.scheduler_tasks.dispatcher.set_rate(GLOBAL_RATE / shard_map.worker_count())
+            if shard_map.count != self.shard_count:
+                await self.adopt_moved_users(self.shard_count, shard_map.count)
+                self.shard_count = shard_map.count
+        # Корпус разбирается в потоке, обработчики тем временем отвечают по старому индексу.
+        # Reload приходит и при каждой перебалансировке: неизменённый файл не перечитываем.
+        self._quotes_reload = asyncio.get_running_loop().create_task(self.quotes.reload_if_changed())
+
+    async def adopt_moved_users(self, old_count, new_count):
+        # PTB загружает сохранённые диалоги и user_data только в Application.initialize,
+        # поэтому состояние пользователей, чьи строки перенёс rebalance_shards.py,
+        # добавляем в память сами, а уехавших забываем
+        def arrived(user_id):
+            return shard_for(user_id, new_count) == self.shard != shard_for(user_id, old_count)
+
+        def left(user_id):
+            return shard_for(user_id, old_count) == self.shard != shard_for(user_id, new_count)
+
+        persistence = self.app.persistence
+        persistence.forget_users(left)
+        conversations = self.conv_handler._conversations
+        for key in [key for key in conversations if left(key[-1])]:
+            conversations.pop(key)
+        for user_id in [user_id for user_id in self.app.user_data if left(user_id)]:
+            self.app.drop_user_data(user_id)
+
+        moved_conversations, moved_user_data = await persistence.load_users(self.conv_handler.name, arrived)
+        conversations.update_no_track(moved_conversations)
+        for user_id, data in moved_user_data.items():
+            # user_data приложения — defaultdict за MappingProxy: обращение создаёт запись
+            self.app.user_data[user_id].update(data)
+
+    async def _serve_webhook(self, webhook_url, host, port, secret_token, on_reload=None):
+        # Импортируем aiohttp только в режиме webhook
+        from webhook_server import WebhookServer
+
+        server = WebhookServer(self.app, host, port, secret_token, on_reload=on_reload)
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        # SIGHUP сбрасывает кэш: после перебалансировки шардов сюда могут вернуться
+        # пользователи, чьи привычки менялись в другом шарде. Заодно обновляем долю
+        # лимита рассылки и перечитываем изменённый файл цитат.
+        loop.add_signal_handler(signal.SIGHUP, self.on_sighup)
+
+        try:
+            async with self.app:
+                await self.lifecycle.startup()
+                await self.app.start()
+                if webhook_url:
+                    await self.app.bot.set_webhook(
+                        webhook_url + server.path, secret_token=secret_token, allowed_updates=Update.ALL_TYPES
+                    )
+                await server.start()
+                try:
+                    await stop.wait()
+                finally:
+                    await server.stop()
+                    await self.app.stop()
+                    await self.lifecycle.drain()
+        finally:
+            # После Application.shutdown: отложенная запись состояния диалогов уже сброшена
+            await self.lifecycle.shutdown()
+
 if __name__ == "__main__":
-    bot = HabitTrackerBot('YOUR_TOKEN')
-    bot.run()
+    # METRICS_PORT включает локальный /metrics, METRICS_PROFILING=1 — ещё и /debug/profile
+    # PROGRESS_MODE=lazy — прогресс по времени считается при чтении; режим должен
+    # совпадать с записанным в базе (сменить его — convert_progress.py)
+    bot = HabitTrackerBot(
+        os.environ.get('BOT_TOKEN', 'YOUR_TOKEN'),
+        progress_mode=os.environ.get('PROGRESS_MODE', PROGRESS_STORED),
+        metrics_port=int(os.environ.get('METRICS_PORT', 0)) or None,
+        metrics_host=os.environ.get('METRICS_HOST'),
+        profiling=os.environ.get('METRICS_PROFILING') == '1',
+        quotes_path=os.environ.get('QUOTES_PATH'),
+        run_scheduler=os.environ.get('RUN_SCHEDULER', '1') == '1',
+    )
+    # WEBHOOK_URL задан — принимаем апдейты по webhook, иначе long polling
+    if os.environ.get('WEBHOOK_URL'):
+        bot.run_webhook(
+            os.environ['WEBHOOK_URL'],
+            host=os.environ.get('WEBHOOK_HOST', '0.0.0.0'),
+            port=int(os.environ.get('WEBHOOK_PORT', 8443)),
+            secret_token=os.environ.get('WEBHOOK_SECRET'),
+        )
+    else:
+        bot.run()
 
@@ -0,0 +1,32 @@
+# Компактные callback_data для inline-кнопок. Telegram ограничивает их 64 байтами,
+# поэтому действие — одна-две буквы, а числа (id привычки, страница) — в base36:
+# 'c:lfls:0' — отметить привычку с id 1000000 и остаться на странице 0.
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+COMPLETE = 'c'
+DELETE = 'd'
+COMPLETE_PAGE = 'cp'
+DELETE_PAGE = 'dp'
+HABIT_ACTIONS = (COMPLETE, DELETE, COMPLETE_PAGE, DELETE_PAGE)
+# Кнопка без действия, например номер страницы: нажатие только подтверждается
+NOOP = 'n'
+
+
+def encode_int(value):
+    if value == 0:
+        return '0'
+    digits = []
+    while value:
+        value, digit = divmod(value, 36)
+        digits.append(DIGITS[digit])
+    return ''.join(reversed(digits))
+
+
+def pack(action, *values):
+    return ':'.join((action, *(encode_int(value) for value in values)))
+
+
+def unpack(data):
+    # Кнопки приходят от клиента, поэтому ValueError на мусоре обрабатывает вызывающий
+    action, *values = data.split(':')
+    return action, [int(value, 36) for value in values]
@@ -0,0 +1,70 @@
+import argparse
+import sqlite3
+import time
+from datetime import datetime
+from habit_repository import DB_PATH
+from migrations import migrate, recorded_progress_mode
+from progress import PROGRESS_LAZY, PROGRESS_MODES, accrued_progress, due_at, effective_progress, started_at
+
+# Перевод базы между режимами прогресса. Бот при этом должен быть остановлен:
+# активные привычки пересчитываются одной транзакцией, и в ней же меняется режим в settings.
+# stored -> lazy: из progress вычитается прирост по времени, заполняется due_at;
+# lazy -> stored: в progress записывается текущий прогресс с приростом, due_at очищается.
+
+SELECT_ACTIVE = 'SELECT id, frequency, progress, total, start_date, created_at FROM habits WHERE archived = 0'
+UPDATE_PROGRESS = 'UPDATE habits SET progress = ?, due_at = ? WHERE id = ?'
+UPDATE_MODE = "INSERT OR REPLACE INTO settings (name, value) VALUES ('progress_mode', ?)"
+
+
+def _converted(rows, mode, now):
+    for habit_id, frequency, progress, total, start_date, created_at in rows:
+        started = started_at(start_date, created_at)
+        if mode == PROGRESS_LAZY:
+            # Если бот простаивал, тиков было меньше полных часов — ручных отметок не меньше нуля
+            manual = max(0, progress - accrued_progress(frequency, started, now))
+            yield manual, due_at(frequency, started, manual, total), habit_id
+        else:
+            yield effective_progress(frequency, started, progress, total, now), None, habit_id
+
+
+def convert(db_path, mode, now=None):
+    # Возвращает (режим до, число пересчитанных привычек)
+    migrate(db_path)
+    now = now or datetime.now()
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            current = recorded_progress_mode(conn)
+            converted = 0
+            if current is not None and current != mode:
+                rows = conn.execute(SELECT_ACTIVE).fetchall()
+                conn.executemany(UPDATE_PROGRESS, _converted(rows, mode, now))
+                converted = len(rows)
+            conn.execute(UPDATE_MODE, (mode,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return current, converted
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Перевод базы в другой режим прогресса (бот должен быть остановлен)')
+    parser.add_argument('mode', choices=PROGRESS_MODES)
+    parser.add_argument('--db', default=DB_PATH, help='путь к базе; для шардов — запуск на каждом файле шарда')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    current, converted = convert(args.db, args.mode)
+    if current == args.mode:
+        print(f"База уже в режиме '{args.mode}'")
+        return
+    print(f"Режим прогресса: {current or 'не задан'} -> {args.mode}, пересчитано привычек: {converted} "
+          f"за {time.perf_counter() - started:.2f} с")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+import time
+from metrics import CACHE_LOOKUPS, CACHE_USERS
+
+# Сколько пользователей держим в памяти и как долго запись считается свежей
+CACHE_MAX_USERS = 50_000
+CACHE_TTL = 300
+# Виды обращений: список привычек и готовый текст прогресса считаются отдельно,
+# иначе одно холодное нажатие «Показать прогресс» давало бы два промаха
+LOOKUP_HABITS = 'habits'
+LOOKUP_RENDERED = 'rendered'
+
+
+class HabitCache:
+    # LRU-кэш активных привычек пользователя и отрисованного текста прогресса.
+    # Любая запись по пользователю сбрасывает его запись целиком. Счётчик поколений
+    # не даёт положить в кэш результат чтения, начатого до сброса.
+    def __init__(self, max_users=CACHE_MAX_USERS, ttl=CACHE_TTL):
+        self.max_users = max_users
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> [expires_at, generation, habits, {key: text}]
+        self._generation = 0
+        self._user_generation = {}
+        self.hits = {LOOKUP_HABITS: 0, LOOKUP_RENDERED: 0}
+        self.misses = {LOOKUP_HABITS: 0, LOOKUP_RENDERED: 0}
+
+    def _count(self, kind, hit):
+        if hit:
+            self.hits[kind] += 1
+        else:
+            self.misses[kind] += 1
+        CACHE_LOOKUPS.inc(kind=kind, result='hit' if hit else 'miss')
+
+    def generation(self, user_id):
+        return self._generation, self._user_generation.get(user_id, 0)
+
+    def _entry(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return entry
+
+    def _store(self, user_id, generation):
+        if generation != self.generation(user_id):
+            return None
+        entry = self._entries.get(user_id)
+        if entry is None or entry[1] != generation:
+            entry = self._entries[user_id] = [time.monotonic() + self.ttl, generation, None, {}]
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+        return entry
+
+    def get_habits(self, user_id):
+        entry = self._entry(user_id)
+        habits = entry[2] if entry is not None else None
+        self._count(LOOKUP_HABITS, habits is not None)
+        return habits
+
+    def put_habits(self, user_id, habits, generation):
+        entry = self._store(user_id, generation)
+        if entry is not None:
+            entry[2] = habits
+
+    def get_rendered(self, user_id, key):
+        entry = self._entry(user_id)
+        text = entry[3].get(key) if entry is not None else None
+        self._count(LOOKUP_RENDERED, text is not None)
+        return text
+
+    def put_rendered(self, user_id, key, text, generation):
+        entry = self._store(user_id, generation)
+        if entry is not None:
+            entry[3][key] = text
+
+    def invalidate(self, user_id):
+        self._entries.pop(user_id, None)
+        self._user_generation[user_id] = self._user_generation.get(user_id, 0) + 1
+        # Счётчики поколений нужны только пока возможны параллельные чтения
+        if len(self._user_generation) > self.max_users:
+            self._user_generation.clear()
+            self._generation += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._user_generation.clear()
+        self._generation += 1
+
+    def stats(self):
+        return {'hits': dict(self.hits), 'misses': dict(self.misses), 'users': len(self._entries)}
+
+    def collect(self):
+        # Сборщик для REGISTRY: размер кэша на момент выдачи метрик
+        CACHE_USERS.set(len(self._entries))
@@ -0,0 +1,594 @@
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import NamedTuple, Optional
+import aiosqlite
+import asyncio
+import json
+import random
+import time
+from progress import PROGRESS_LAZY, PROGRESS_STORED, due_at, effective_progress, started_at
+from habit_cache import HabitCache
+from migrations import check_progress_mode, migrate
+from metrics import DB_POOL_WAIT_SECONDS, track_query
+from reminder_slots import next_due_at
+from streaks import next_streak
+
+DB_PATH = 'grim_hustle.db'
+
+# Все запросы держим константами: sqlite3 кэширует подготовленные выражения
+# по тексту SQL, поэтому одинаковая строка не компилируется повторно.
+INSERT_HABIT = (
+    'INSERT INTO habits (user_id, habit_name, frequency, total, start_date, created_at, due_at) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?)'
+)
+SELECT_ACTIVE_BY_ID = (
+    'SELECT id, habit_name, frequency, progress, total, start_date, streak, last_completed_at, created_at '
+    'FROM habits WHERE id = ? AND user_id = ? AND archived = 0'
+)
+# Отметка обновляет агрегаты привычки; сама отметка уходит в журнал habit_events
+UPDATE_COMPLETION = (
+    'UPDATE habits SET progress = ?, archived = ?, streak = ?, last_completed_at = ?, '
+    'completions = completions + 1 WHERE id = ?'
+)
+UPDATE_MANUAL_COMPLETION = (
+    'UPDATE habits SET progress = ?, due_at = ?, streak = ?, last_completed_at = ?, '
+    'completions = completions + 1 WHERE id = ?'
+)
+INSERT_EVENT = (
+    'INSERT INTO habit_events (habit_id, user_id, kind, amount, progress, created_at) VALUES (?, ?, ?, ?, ?, ?)'
+)
+SOFT_DELETE_BY_ID = (
+    'UPDATE habits SET archived = 1, deleted_at = ? WHERE id = ? AND user_id = ? AND deleted_at IS NULL '
+    'RETURNING habit_name, progress'
+)
+SELECT_USER_HABITS = (
+    'SELECT id, habit_name, frequency, progress, total, start_date, streak, last_completed_at, created_at '
+    'FROM habits WHERE user_id = ? AND archived = 0 ORDER BY habit_name, id'
+)
+# История — постранично по индексу журнала, от новых событий к старым
+SELECT_USER_HISTORY = (
+    'SELECT e.id, e.habit_id, h.habit_name, e.kind, e.amount, e.progress, e.created_at '
+    'FROM habit_events e JOIN habits h ON h.id = e.habit_id '
+    'WHERE e.user_id = ? AND e.id < ? ORDER BY e.id DESC LIMIT ?'
+)
+SELECT_ACTIVE_ID_RANGE = 'SELECT MIN(id), MAX(id) FROM habits WHERE archived = 0'
+SELECT_NEXT_ID = 'SELECT MIN(id) FROM habits WHERE id >= ?'
+SELECT_MISSING_DUE_AT = (
+    'SELECT id, frequency, progress, total, start_date, created_at FROM habits '
+    'WHERE archived = 0 AND due_at IS NULL'
+)
+UPDATE_DUE_AT = 'UPDATE habits SET due_at = ? WHERE id = ?'
+# Группировка по пользователю в SQL: одна строка на пользователя со списком
+# его активных привычек [[id, habit_name, frequency], ...]. Список user_id и
+# частот, которые сегодня не напоминаются, подставляется при вызове.
+SELECT_REMINDER_HABITS_BY_USER = (
+    'SELECT user_id, json_group_array(json_array(id, habit_name, frequency)) FROM habits '
+    'WHERE user_id IN ({users}) AND archived = 0 AND is_blocked = 0 AND frequency NOT IN ({skip}) '
+    'GROUP BY user_id'
+)
+MARK_USER_BLOCKED = 'UPDATE habits SET is_blocked = 1 WHERE user_id = ?'
+UNBLOCK_USER = 'UPDATE habits SET is_blocked = 0 WHERE user_id = ? AND is_blocked = 1'
+
+INSERT_OUTBOX = (
+    'INSERT OR IGNORE INTO reminder_outbox (dedup_key, user_id, text, reply_markup, created_at) VALUES (?, ?, ?, ?, ?)'
+)
+SELECT_PENDING_OUTBOX = (
+    "SELECT id, user_id, text, reply_markup, attempts FROM reminder_outbox WHERE status = 'pending' AND id > ? ORDER BY id LIMIT ?"
+)
+UPDATE_OUTBOX_STATUS = 'UPDATE reminder_outbox SET status = ?, attempts = ?, sent_at = ? WHERE id = ?'
+# Старые строки ищутся по индексу created_at и удаляются пачками: каждая пачка —
+# короткая транзакция, и запись обработчиков не ждёт чистки всей таблицы
+PURGE_OUTBOX = (
+    'DELETE FROM reminder_outbox WHERE id IN ('
+    "SELECT id FROM reminder_outbox WHERE created_at < ? AND status != 'pending' LIMIT ?)"
+)
+OUTBOX_RETENTION = 7 * 24 * 3600
+OUTBOX_PURGE_BATCH = 1000
+
+INSERT_SLOT = 'INSERT OR IGNORE INTO reminder_slots (user_id, next_due_at) VALUES (?, ?)'
+UPSERT_SLOT = (
+    'INSERT INTO reminder_slots (user_id, timezone, preferred_hour, next_due_at) VALUES (?, ?, ?, ?) '
+    'ON CONFLICT(user_id) DO UPDATE SET timezone = excluded.timezone, '
+    'preferred_hour = excluded.preferred_hour, next_due_at = excluded.next_due_at'
+)
+SELECT_DUE_SLOTS = (
+    'SELECT user_id, timezone, preferred_hour FROM reminder_slots WHERE next_due_at <= ? ORDER BY next_due_at LIMIT ?'
+)
+UPDATE_SLOT_DUE = 'UPDATE reminder_slots SET next_due_at = ? WHERE user_id = ?'
+SELECT_USERS_WITHOUT_SLOT = (
+    'SELECT DISTINCT user_id FROM habits WHERE archived = 0 '
+    'AND user_id NOT IN (SELECT user_id FROM reminder_slots)'
+)
+
+SELECT_CONVERSATIONS = 'SELECT key, state FROM conversations WHERE name = ? AND updated_at >= ?'
+UPSERT_CONVERSATION = (
+    'INSERT INTO conversations (name, key, state, updated_at) VALUES (?, ?, ?, ?) '
+    'ON CONFLICT(name, key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at'
+)
+DELETE_CONVERSATION = 'DELETE FROM conversations WHERE name = ? AND key = ?'
+EXPIRE_CONVERSATIONS = 'DELETE FROM conversations WHERE updated_at < ?'
+SELECT_USER_DATA = 'SELECT user_id, data FROM user_data WHERE updated_at >= ?'
+UPSERT_USER_DATA = (
+    'INSERT INTO user_data (user_id, data, updated_at) VALUES (?, ?, ?) '
+    'ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at'
+)
+DELETE_USER_DATA = 'DELETE FROM user_data WHERE user_id = ?'
+EXPIRE_USER_DATA = 'DELETE FROM user_data WHERE updated_at < ?'
+
+ARCHIVE_DUE = (
+    'UPDATE habits SET progress = total, archived = 1 WHERE archived = 0 AND due_at <= ? RETURNING user_id'
+)
+
+# Следующая позиция ротации цитат одним запросом: в конце цикла или при смене
+# размера пула начинается новый цикл с новым seed
+ADVANCE_QUOTE_ROTATION = (
+    'INSERT INTO quote_rotation (user_id, pool, seed, cursor, size) VALUES (?, ?, ?, 0, ?) '
+    'ON CONFLICT (user_id, pool) DO UPDATE SET '
+    'seed = CASE WHEN cursor + 1 >= excluded.size OR size != excluded.size THEN excluded.seed ELSE seed END, '
+    'cursor = CASE WHEN cursor + 1 >= excluded.size OR size != excluded.size THEN 0 ELSE cursor + 1 END, '
+    'size = excluded.size '
+    'RETURNING seed, cursor'
+)
+
+PROGRESS_CHUNK_SIZE = 5000
+HISTORY_PAGE_SIZE = 10
+MAX_EVENT_ID = 1 << 62
+EVENT_COMPLETE = 'complete'
+EVENT_DELETE = 'delete'
+
+
+class Habit(NamedTuple):
+    id: int
+    habit_name: str
+    frequency: str
+    progress: float
+    total: int
+    start_date: str
+    streak: int
+    last_completed_at: Optional[int]
+    created_at: Optional[int]
+
+
+class OutboxMessage(NamedTuple):
+    id: int
+    user_id: int
+    text: str
+    reply_markup: Optional[str]
+    attempts: int
+
+
+class ReminderSlot(NamedTuple):
+    user_id: int
+    timezone: Optional[str]
+    preferred_hour: Optional[int]
+
+
+class ReminderHabit(NamedTuple):
+    id: int
+    habit_name: str
+    frequency: str
+
+
+class Completion(NamedTuple):
+    habit_name: str
+    progress: float
+    total: int
+    archived: bool
+    streak: int
+
+
+class HistoryEvent(NamedTuple):
+    id: int
+    habit_id: int
+    habit_name: str
+    kind: str
+    amount: float
+    progress: float
+    created_at: int
+
+
+class HabitRepository:
+    # Общий асинхронный слой доступа к данным для бота и планировщика.
+    # Держит одно соединение на запись (SQLite всё равно сериализует писателей)
+    # и небольшой пул соединений на чтение; в режиме WAL читатели не ждут писателя.
+    # setup(db_path) готовит схему один раз, перед первым соединением пула;
+    # тогда же режим прогресса сверяется с записанным в базе.
+    def __init__(self, db_path=DB_PATH, pool_size=4, progress_mode=PROGRESS_STORED, cache_options=None,
+                 setup=migrate):
+        self.db_path = db_path
+        self.setup = setup
+        self.pool_size = pool_size
+        self.progress_mode = progress_mode
+        self._readers = None
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._open_lock = asyncio.Lock()
+        self._connections = []
+        self.cache = HabitCache(**(cache_options or {}))
+        self._completions = []
+        self._completion_task = None
+
+    async def _connect(self):
+        conn = await aiosqlite.connect(self.db_path, cached_statements=256)
+        # busy_timeout первым: соединения пула открываются одновременно
+        await conn.execute('PRAGMA busy_timeout=5000')
+        await conn.execute('PRAGMA journal_mode=WAL')
+        await conn.execute('PRAGMA synchronous=NORMAL')
+        self._connections.append(conn)
+        return conn
+
+    async def open(self):
+        async with self._open_lock:
+            if self._writer is not None:
+                return
+            if self.setup is not None:
+                await asyncio.get_running_loop().run_in_executor(None, self._prepare)
+                self.setup = None
+            # Соединения открываются параллельно: у каждого свой поток aiosqlite
+            connections = await asyncio.gather(*(self._connect() for _ in range(self.pool_size + 1)))
+            readers = asyncio.Queue()
+            for conn in connections[1:]:
+                readers.put_nowait(conn)
+            self._writer = connections[0]
+            self._readers = readers
+
+    def _prepare(self):
+        self.setup(self.db_path)
+        check_progress_mode(self.db_path, self.progress_mode)
+
+    async def close(self):
+        # Дописываем отметки, ожидающие групповой записи
+        if self._completion_task is not None:
+            await asyncio.gather(self._completion_task, return_exceptions=True)
+        async with self._open_lock:
+            for conn in self._connections:
+                await conn.close()
+            self._connections = []
+            self._writer = None
+            self._readers = None
+
+    @asynccontextmanager
+    async def _read(self):
+        if self._readers is None:
+            await self.open()
+        started = time.perf_counter()
+        conn = await self._readers.get()
+        DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started, mode='read')
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def _write(self):
+        if self._writer is None:
+            await self.open()
+        started = time.perf_counter()
+        async with self._write_lock:
+            DB_POOL_WAIT_SECONDS.observe(time.perf_counter() - started, mode='write')
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            else:
+                await self._writer.commit()
+
+    @property
+    def lazy(self):
+        return self.progress_mode == PROGRESS_LAZY
+
+    @track_query
+    async def add_habit(self, user_id, habit_name, frequency, total=30) -> int:
+        now = datetime.now().replace(microsecond=0)
+        finish_at = due_at(frequency, now, 0, total) if self.lazy else None
+        async with self._write() as conn:
+            cursor = await conn.execute(INSERT_HABIT, (
+                user_id, habit_name, frequency, total, now.strftime('%Y-%m-%d'), int(now.timestamp()), finish_at,
+            ))
+            # Слот напоминаний создаётся вместе с первой привычкой пользователя
+            await conn.execute(INSERT_SLOT, (user_id, next_due_at(user_id)))
+        # Кэш сбрасываем после коммита, чтобы параллельное чтение не закэшировало старые данные
+        self.cache.invalidate(user_id)
+        return cursor.lastrowid
+
+    @track_query
+    async def complete_habit_by_id(self, user_id, habit_id, step=10) -> Optional[Completion]:
+        return await self._submit_completion(user_id, SELECT_ACTIVE_BY_ID, (habit_id, user_id), step)
+
+    async def _submit_completion(self, user_id, query, params, step):
+        # Групповая запись отметок: пока идёт одна транзакция, новые отметки копятся
+        # и следующей транзакцией пишутся вместе — одним executemany в журнал и
+        # одним коммитом. Вызывающий получает результат после коммита своей пачки.
+        future = asyncio.get_running_loop().create_future()
+        self._completions.append((user_id, query, params, step, future))
+        if self._completion_task is None or self._completion_task.done():
+            self._completion_task = asyncio.get_running_loop().create_task(self._write_completions())
+        return await future
+
+    async def _write_completions(self):
+        while self._completions:
+            batch, self._completions = self._completions, []
+            now = datetime.now()
+            results = []
+            try:
+                async with self._write() as conn:
+                    events = []
+                    for user_id, query, params, step, _ in batch:
+                        async with conn.execute(query, params) as cursor:
+                            habit = await cursor.fetchone()
+                        completion = await self._complete(conn, habit, step, now)
+                        results.append(completion)
+                        if completion is not None:
+                            events.append((habit[0], user_id, EVENT_COMPLETE, step, completion.progress,
+                                           int(now.timestamp())))
+                    await conn.executemany(INSERT_EVENT, events)
+            except BaseException as e:
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                if not isinstance(e, Exception):
+                    raise
+                continue
+            for (user_id, *_, future), completion in zip(batch, results):
+                self.cache.invalidate(user_id)
+                if not future.done():
+                    future.set_result(completion)
+
+    async def _complete(self, conn, habit, step, now):
+        if habit is None:
+            return None
+
+        habit_id, habit_name, frequency, progress, total, start_date, streak, last_completed_at, created_at = habit
+        started = started_at(start_date, created_at)
+        if self.lazy:
+            # В progress хранятся только ручные отметки, прирост по времени досчитываем
+            current = effective_progress(frequency, started, progress, total, now)
+        else:
+            current = progress
+        new_progress = current + step
+        streak = next_streak(frequency, streak or 0, last_completed_at, now)
+        completed_at = int(now.timestamp())
+        # Если прогресс достиг или превысил цель, архивируем привычку
+        if new_progress >= total:
+            await conn.execute(UPDATE_COMPLETION, (total, 1, streak, completed_at, habit_id))
+            return Completion(habit_name, total, total, True, streak)
+        if self.lazy:
+            manual = progress + step
+            await conn.execute(
+                UPDATE_MANUAL_COMPLETION,
+                (manual, due_at(frequency, started, manual, total), streak, completed_at, habit_id),
+            )
+        else:
+            await conn.execute(UPDATE_COMPLETION, (new_progress, 0, streak, completed_at, habit_id))
+        return Completion(habit_name, new_progress, total, False, streak)
+
+    @track_query
+    async def delete_habit_by_id(self, user_id, habit_id) -> Optional[str]:
+        # Мягкое удаление: привычка уходит из активных, её история остаётся.
+        # Возвращает название удалённой привычки или None, если её нет
+        deleted_at = int(time.time())
+        async with self._write() as conn:
+            async with conn.execute(SOFT_DELETE_BY_ID, (deleted_at, habit_id, user_id)) as cursor:
+                deleted = await cursor.fetchone()
+            if deleted is None:
+                return None
+            habit_name, progress = deleted
+            await conn.execute(INSERT_EVENT, (habit_id, user_id, EVENT_DELETE, 0, progress, deleted_at))
+        self.cache.invalidate(user_id)
+        return habit_name
+
+    @track_query
+    async def list_history(self, user_id, before_id=None, limit=HISTORY_PAGE_SIZE) -> list[HistoryEvent]:
+        # Страница истории: события старше before_id, от новых к старым.
+        # Следующая страница запрашивается с before_id = id последнего события.
+        before_id = before_id or MAX_EVENT_ID
+        async with self._read() as conn:
+            async with conn.execute(SELECT_USER_HISTORY, (user_id, before_id, limit)) as cursor:
+                return [HistoryEvent(*row) for row in await cursor.fetchall()]
+
+    @track_query
+    async def list_habits(self, user_id) -> list[Habit]:
+        # Список привычек читается через кэш; в ленивом режиме в кэше лежат
+        # сырые строки, а прогресс по времени досчитывается при каждом чтении
+        habits = self.cache.get_habits(user_id)
+        if habits is None:
+            generation = self.cache.generation(user_id)
+            async with self._read() as conn:
+                async with conn.execute(SELECT_USER_HABITS, (user_id,)) as cursor:
+                    habits = [Habit(*row) for row in await cursor.fetchall()]
+            self.cache.put_habits(user_id, habits, generation)
+        if self.lazy:
+            now = datetime.now()
+            habits = [
+                habit._replace(progress=effective_progress(
+                    habit.frequency, started_at(habit.start_date, habit.created_at), habit.progress, habit.total, now
+                ))
+                for habit in habits
+            ]
+        return habits
+
+    @track_query
+    async def list_reminder_habits_by_user(self, user_ids, skip_frequencies=()):
+        # Активные привычки указанных пользователей, не заблокировавших бота,
+        # сгруппированные по user_id: [(user_id, [ReminderHabit, ...]), ...]
+        if not user_ids:
+            return []
+        sql = SELECT_REMINDER_HABITS_BY_USER.format(
+            users=', '.join('?' * len(user_ids)), skip=', '.join('?' * len(skip_frequencies))
+        )
+        async with self._read() as conn:
+            async with conn.execute(sql, (*user_ids, *skip_frequencies)) as cursor:
+                rows = await cursor.fetchall()
+        return [(user_id, [ReminderHabit(*habit) for habit in json.loads(habits)]) for user_id, habits in rows]
+
+    @track_query
+    async def fetch_due_slots(self, now_ts, limit) -> list[ReminderSlot]:
+        async with self._read() as conn:
+            async with conn.execute(SELECT_DUE_SLOTS, (now_ts, limit)) as cursor:
+                return [ReminderSlot(*row) for row in await cursor.fetchall()]
+
+    @track_query
+    async def next_quote_position(self, user_id, pool, size):
+        # (seed, cursor) для следующей цитаты пользователя из пула размера size
+        async with self._write() as conn:
+            async with conn.execute(
+                ADVANCE_QUOTE_ROTATION, (user_id, pool, random.getrandbits(63), size)
+            ) as cursor:
+                return await cursor.fetchone()
+
+    @track_query
+    async def set_reminder_slot(self, user_id, timezone, preferred_hour):
+        async with self._write() as conn:
+            await conn.execute(
+                UPSERT_SLOT, (user_id, timezone, preferred_hour, next_due_at(user_id, timezone, preferred_hour))
+            )
+
+    @track_query
+    async def ensure_reminder_slots(self):
+        # Слоты для пользователей, добавивших привычки до появления слотов
+        async with self._read() as conn:
+            async with conn.execute(SELECT_USERS_WITHOUT_SLOT) as cursor:
+                user_ids = [row[0] for row in await cursor.fetchall()]
+        if user_ids:
+            async with self._write() as conn:
+                await conn.executemany(INSERT_SLOT, [(user_id, next_due_at(user_id)) for user_id in user_ids])
+        return len(user_ids)
+
+    @track_query
+    async def mark_user_blocked(self, user_id):
+        async with self._write() as conn:
+            await conn.execute(MARK_USER_BLOCKED, (user_id,))
+
+    @track_query
+    async def unblock_user(self, user_id):
+        async with self._write() as conn:
+            await conn.execute(UNBLOCK_USER, (user_id,))
+
+    @track_query
+    async def enqueue_outbox(self, messages, slot_updates=()):
+        # messages — кортежи (dedup_key, user_id, text, reply_markup); повторная
+        # постановка того же ключа игнорируется, так что перезапуск не дублирует рассылку.
+        # slot_updates — пары (next_due_at, user_id): слоты сдвигаются в той же транзакции.
+        created_at = int(time.time())
+        async with self._write() as conn:
+            cursor = await conn.executemany(
+                INSERT_OUTBOX, [(*message, created_at) for message in messages]
+            )
+            if slot_updates:
+                await conn.executemany(UPDATE_SLOT_DUE, slot_updates)
+            return cursor.rowcount
+
+    @track_query
+    async def fetch_pending_outbox(self, after_id, limit) -> list[OutboxMessage]:
+        async with self._read() as conn:
+            async with conn.execute(SELECT_PENDING_OUTBOX, (after_id, limit)) as cursor:
+                return [OutboxMessage(*row) for row in await cursor.fetchall()]
+
+    @track_query
+    async def mark_outbox(self, message_id, status, attempts):
+        async with self._write() as conn:
+            await conn.execute(UPDATE_OUTBOX_STATUS, (status, attempts, int(time.time()), message_id))
+
+    @track_query
+    async def purge_outbox(self, retention=OUTBOX_RETENTION, batch_size=OUTBOX_PURGE_BATCH):
+        expire_before = int(time.time()) - retention
+        purged = 0
+        while True:
+            async with self._write() as conn:
+                cursor = await conn.execute(PURGE_OUTBOX, (expire_before, batch_size))
+            purged += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                return purged
+
+    @track_query
+    async def load_conversations(self, name, updated_after):
+        async with self._read() as conn:
+            async with conn.execute(SELECT_CONVERSATIONS, (name, updated_after)) as cursor:
+                return await cursor.fetchall()
+
+    @track_query
+    async def load_user_data(self, updated_after):
+        async with self._read() as conn:
+            async with conn.execute(SELECT_USER_DATA, (updated_after,)) as cursor:
+                return await cursor.fetchall()
+
+    @track_query
+    async def save_persistence(self, conversations, user_data, expire_before):
+        # Пачка изменений состояния диалогов одной транзакцией; state/data = None — удаление.
+        # Заодно удаляем диалоги, брошенные дольше TTL.
+        async with self._write() as conn:
+            await conn.executemany(
+                UPSERT_CONVERSATION, [row for row in conversations if row[2] is not None]
+            )
+            await conn.executemany(
+                DELETE_CONVERSATION, [(name, key) for name, key, state, _ in conversations if state is None]
+            )
+            await conn.executemany(UPSERT_USER_DATA, [row for row in user_data if row[1] is not None])
+            await conn.executemany(DELETE_USER_DATA, [(user_id,) for user_id, data, _ in user_data if data is None])
+            await conn.execute(EXPIRE_CONVERSATIONS, (expire_before,))
+            await conn.execute(EXPIRE_USER_DATA, (expire_before,))
+
+    @track_query
+    async def tick_progress(self, increments, chunk_size=PROGRESS_CHUNK_SIZE):
+        # Массовое начисление прогресса: по два set-based UPDATE на диапазон id.
+        # Каждый диапазон — отдельная короткая транзакция, чтобы запись
+        # пользователей не ждала весь тик целиком.
+        case_sql = 'CASE frequency ' + 'WHEN ? THEN ? ' * len(increments) + 'ELSE 0 END'
+        case_params = [value for item in increments.items() for value in item]
+        # «+archived» отключает индексы по archived: диапазон должен идти по первичному
+        # ключу, иначе каждый кусок заново просматривает все активные привычки
+        archive_sql = (
+            'UPDATE habits SET progress = total, archived = 1 '
+            f'WHERE +archived = 0 AND id >= ? AND id < ? AND progress + {case_sql} >= total'
+        )
+        increment_sql = (
+            f'UPDATE habits SET progress = progress + {case_sql} '
+            'WHERE +archived = 0 AND id >= ? AND id < ?'
+        )
+
+        async with self._read() as conn:
+            async with conn.execute(SELECT_ACTIVE_ID_RANGE) as cursor:
+                low, high = await cursor.fetchone()
+        if low is None:
+            return 0, 0
+
+        updated = archived = 0
+        chunk_start = low
+        while chunk_start is not None and chunk_start <= high:
+            chunk_end = chunk_start + chunk_size
+            async with self._write() as conn:
+                cursor = await conn.execute(archive_sql, (chunk_start, chunk_end, *case_params))
+                archived += cursor.rowcount
+                cursor = await conn.execute(increment_sql, (*case_params, chunk_start, chunk_end))
+                updated += cursor.rowcount
+                # В шарде id идут с разрывами (свой диапазон и перенесённые из других
+                # шардов), поэтому следующий кусок начинается с ближайшего существующего id
+                async with conn.execute(SELECT_NEXT_ID, (chunk_end,)) as cursor:
+                    chunk_start = (await cursor.fetchone())[0]
+            # Тик меняет прогресс всех пользователей
+            self.cache.clear()
+        return updated, archived
+
+    @track_query
+    async def archive_due(self, now=None):
+        # Ленивый режим: архивируем только привычки, чей due_at уже наступил.
+        # Поиск идёт по индексу (archived, due_at), а не по всей таблице.
+        now = now or datetime.now()
+        async with self._read() as conn:
+            async with conn.execute(SELECT_MISSING_DUE_AT) as cursor:
+                missing = await cursor.fetchall()
+        backfill = [
+            (due_at(frequency, started_at(start_date, created_at), progress, total), habit_id)
+            for habit_id, frequency, progress, total, start_date, created_at in missing
+        ]
+        backfill = [row for row in backfill if row[0] is not None]
+
+        async with self._write() as conn:
+            if backfill:
+                await conn.executemany(UPDATE_DUE_AT, backfill)
+            async with conn.execute(ARCHIVE_DUE, (int(now.timestamp()),)) as cursor:
+                archived_users = [row[0] for row in await cursor.fetchall()]
+        for user_id in set(archived_users):
+            self.cache.invalidate(user_id)
+        return len(archived_users)
@@ -0,0 +1,58 @@
+import asyncio
+import time
+from apscheduler.triggers.interval import IntervalTrigger
+from metrics import STARTUP_SECONDS
+
+# Сколько при остановке ждём идущую рассылку и тик прогресса. Меньше типичного
+# срока между SIGTERM и SIGKILL (30 с в Kubernetes), чтобы успеть закрыть базу.
+DRAIN_TIMEOUT = 20
+
+
+class Lifecycle:
+    # Запуск и остановка бота одним путём для polling, webhook и воркеров шардов.
+    # Подключается к Application: post_init -> startup, post_stop -> drain,
+    # post_shutdown -> shutdown. При остановке Application.stop сначала перестаёт
+    # принимать апдейты, затем drain даёт доработать задачам планировщика, пока
+    # клиент Bot API ещё открыт, и после Application.shutdown (там же сбрасывается
+    # состояние диалогов) shutdown дописывает отметки и закрывает пул соединений.
+    def __init__(self, bot, drain_timeout=DRAIN_TIMEOUT):
+        self.bot = bot
+        self.drain_timeout = drain_timeout
+        self.created_at = time.perf_counter()
+        self.startup_seconds = None
+        self._quotes_task = None
+        self._drained = False
+
+    async def startup(self, application=None):
+        bot = self.bot
+        # Схема и пул соединений; обычно их уже открыла загрузка состояния диалогов
+        await bot.repository.open()
+        # Большой корпус цитат грузится в фоне и не задерживает запуск
+        self._quotes_task = asyncio.get_running_loop().create_task(bot.quotes.reload())
+        if bot.quotes.path:
+            # Изменённый файл корпуса подхватывается без перезапуска
+            bot.scheduler_tasks.scheduler.add_job(
+                bot.quotes.reload_if_changed, IntervalTrigger(minutes=5), id='quotes_reload', replace_existing=True
+            )
+        # Планировщик стартует на уже работающем цикле событий
+        bot.scheduler_tasks.start(run_jobs=bot.run_scheduler)
+        await bot.start_observability()
+        self.startup_seconds = time.perf_counter() - self.created_at
+        STARTUP_SECONDS.set(self.startup_seconds)
+
+    async def drain(self, application=None):
+        if self._drained:
+            return
+        self._drained = True
+        unfinished = await self.bot.scheduler_tasks.drain(self.drain_timeout)
+        if unfinished:
+            print(f"Остановка: задач планировщика прервано по таймауту: {unfinished}")
+        if self._quotes_task is not None:
+            self._quotes_task.cancel()
+
+    async def shutdown(self, application=None):
+        # drain здесь на случай остановки без Application.stop (ошибка при запуске)
+        await self.drain()
+        await self.bot.stop_observability()
+        # Потоки соединений aiosqlite не фоновые: без закрытия процесс не завершится
+        await self.bot.repository.close()
@@ -0,0 +1,265 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import asyncio
+import functools
+import math
+import time
+
+# Границы корзин гистограмм в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0, 5.0)
+JOB_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+# Как часто меряем задержку цикла событий
+LOOP_LAG_INTERVAL = 0.5
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def _key(self, labels):
+        # Метки передаются именованными аргументами: REMINDERS.inc(status='sent')
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name}: ожидаются метки {self.labelnames}, получены {tuple(labels)}')
+        return tuple(labels[name] for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            # [счётчики по корзинам (последняя — +Inf), сумма, количество]
+            entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        entry = self._values.get(self._key(labels))
+        return entry[2] if entry else 0
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, (('le', _format_value(bound)),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    # Метрики живут в памяти процесса и отдаются в текстовом формате Prometheus.
+    # Все обновления идут из цикла событий, поэтому блокировки не нужны.
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f'Метрика {metric.name} уже зарегистрирована')
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector):
+        # Функция без аргументов, обновляющая значения перед каждой выдачей
+        self._collectors.append(collector)
+
+    def remove_collector(self, collector):
+        if collector in self._collectors:
+            self._collectors.remove(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"Ошибка сбора метрик: {e}")
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+HANDLER_SECONDS = histogram('bot_handler_duration_seconds', 'Время работы обработчика апдейта', ('handler',))
+HANDLER_ERRORS = counter('bot_handler_errors_total', 'Исключения в обработчиках апдейтов', ('handler',))
+DB_QUERY_SECONDS = histogram(
+    'bot_db_query_duration_seconds', 'Время операции HabitRepository, включая ожидание соединения',
+    ('query',), DB_BUCKETS,
+)
+DB_QUERY_ERRORS = counter('bot_db_query_errors_total', 'Ошибки операций HabitRepository', ('query',))
+DB_POOL_WAIT_SECONDS = histogram(
+    'bot_db_pool_wait_seconds', 'Ожидание свободного соединения (read) или блокировки писателя (write)',
+    ('mode',), DB_BUCKETS,
+)
+JOB_SECONDS = histogram('bot_scheduler_job_duration_seconds', 'Длительность задачи планировщика', ('job',), JOB_BUCKETS)
+JOB_ERRORS = counter('bot_scheduler_job_errors_total', 'Задачи планировщика, завершившиеся ошибкой', ('job',))
+JOB_ROWS = counter('bot_scheduler_job_rows_total', 'Строки, обработанные задачами планировщика', ('job', 'kind'))
+JOB_LAST_SUCCESS = gauge(
+    'bot_scheduler_job_last_success_timestamp_seconds', 'Время последнего успешного запуска задачи', ('job',)
+)
+REMINDERS = counter('bot_reminders_total', 'Итог отправки напоминаний из outbox', ('status',))
+REMINDER_SEND_SECONDS = histogram('bot_reminder_send_duration_seconds', 'Длительность вызова sendMessage')
+REMINDER_RETRIES = counter('bot_reminder_retries_total', 'Повторные попытки после временной ошибки Telegram')
+REMINDER_FLOOD_WAITS = counter('bot_reminder_flood_waits_total', 'Ответы RetryAfter от Telegram')
+REMINDER_FLOOD_WAIT_SECONDS = counter(
+    'bot_reminder_flood_wait_seconds_total', 'Суммарная пауза рассылки по RetryAfter'
+)
+LOOP_LAG_SECONDS = histogram('bot_event_loop_lag_seconds', 'Опоздание пробуждения цикла событий', buckets=LAG_BUCKETS)
+LOOP_LAG_MAX = gauge('bot_event_loop_lag_max_seconds', 'Наибольшее опоздание цикла событий с прошлой выдачи метрик')
+CACHE_LOOKUPS = counter(
+    'bot_cache_lookups_total', 'Обращения к кэшу привычек: список (habits) или текст прогресса (rendered)',
+    ('kind', 'result'),
+)
+CACHE_USERS = gauge('bot_cache_users', 'Пользователей в кэше привычек')
+QUOTES_LOADED = gauge('bot_quotes_loaded', 'Цитат в загруженном корпусе')
+STARTUP_SECONDS = gauge('bot_startup_duration_seconds', 'Время от создания бота до готовности принимать апдейты')
+
+
+def timed(histogram, errors=None, **labels):
+    # Декоратор корутины: длительность в histogram, исключения в errors
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(**labels)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+
+def track_handler(func):
+    return timed(HANDLER_SECONDS, HANDLER_ERRORS, handler=func.__name__)(func)
+
+
+def track_query(func):
+    return timed(DB_QUERY_SECONDS, DB_QUERY_ERRORS, query=func.__name__)(func)
+
+
+def track_job(name):
+    return timed(JOB_SECONDS, JOB_ERRORS, job=name)
+
+
+class LoopLagMonitor:
+    # Спит interval секунд и меряет, насколько позже цикл событий её разбудил.
+    # Рост задержки значит, что какой-то обработчик блокирует цикл.
+    def __init__(self, interval=LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self._task = None
+        self._max_lag = 0.0
+
+    def _collect(self):
+        LOOP_LAG_MAX.set(self._max_lag)
+        self._max_lag = 0.0
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            LOOP_LAG_SECONDS.observe(lag)
+            self._max_lag = max(self._max_lag, lag)
+
+    def start(self):
+        if self._task is None:
+            REGISTRY.add_collector(self._collect)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        REGISTRY.remove_collector(self._collect)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,42 @@
+from aiohttp import web
+from metrics import REGISTRY
+
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsServer:
+    # Локальный HTTP-эндпоинт /metrics для Prometheus. По умолчанию слушает
+    # только 127.0.0.1; с profiler доступен /debug/profile?seconds=10.
+    def __init__(self, host=METRICS_HOST, port=METRICS_PORT, registry=REGISTRY, profiler=None):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self.profiler = profiler
+        self._runner = None
+
+        self.web_app = web.Application()
+        self.web_app.router.add_get('/metrics', self.handle_metrics)
+        if profiler is not None:
+            self.web_app.router.add_get('/debug/profile', self.handle_profile)
+
+    async def handle_metrics(self, request):
+        return web.Response(body=self.registry.render().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+    async def handle_profile(self, request):
+        try:
+            seconds = float(request.query.get('seconds', 10))
+        except ValueError:
+            return web.Response(status=400, text='seconds должно быть числом')
+        return web.Response(text=await self.profiler.profile(seconds))
+
+    async def start(self):
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
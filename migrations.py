@@ -0,0 +1,224 @@
+import sqlite3
+from progress import PROGRESS_MODES, PROGRESS_STORED
+
+# Версионированная схема базы. Номер применённой версии хранится в
+# PRAGMA user_version; при запуске все недостающие миграции применяются
+# одной транзакцией. Новые изменения схемы — только новой записью в конце MIGRATIONS.
+
+
+def _columns(conn, table):
+    return {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+
+
+def _add_column(conn, table, column, definition):
+    # Базы, созданные до миграций, могут уже содержать колонку
+    if column not in _columns(conn, table):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+def _v1_habits(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS habits (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            habit_name TEXT,
+            frequency TEXT,
+            progress INTEGER DEFAULT 0,
+            total INTEGER,
+            start_date TEXT,
+            archived INTEGER DEFAULT 0
+        )
+    ''')
+    _add_column(conn, 'habits', 'archived', 'INTEGER DEFAULT 0')
+    _add_column(conn, 'habits', 'is_blocked', 'INTEGER DEFAULT 0')
+
+
+def _v2_due_at(conn):
+    # Момент достижения цели для ленивого режима прогресса
+    _add_column(conn, 'habits', 'due_at', 'INTEGER')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_habits_archived_due_at ON habits (archived, due_at)')
+
+
+def _v3_reminder_outbox(conn):
+    # Очередь исходящих напоминаний: переживает перезапуск посреди рассылки
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            dedup_key TEXT UNIQUE,
+            user_id INTEGER,
+            text TEXT,
+            reply_markup TEXT,
+            status TEXT DEFAULT 'pending',
+            attempts INTEGER DEFAULT 0,
+            created_at INTEGER,
+            sent_at INTEGER
+        )
+    ''')
+    _add_column(conn, 'reminder_outbox', 'reply_markup', 'TEXT')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_outbox_status ON reminder_outbox (status, id)')
+
+
+def _v4_reminder_slots(conn):
+    # Слоты напоминаний: часовой пояс и час пользователя, ближайшее время отправки
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_slots (
+            user_id INTEGER PRIMARY KEY,
+            timezone TEXT,
+            preferred_hour INTEGER,
+            next_due_at INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_reminder_slots_next_due_at ON reminder_slots (next_due_at)')
+
+
+def _v5_habit_indexes(conn):
+    # Все пользовательские запросы идут по (user_id, archived[, habit_name]);
+    # этот индекс покрывает и выборку привычек пачкой пользователей для напоминаний
+    conn.execute('DROP INDEX IF EXISTS idx_habits_user_archived')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_habits_user_archived_name ON habits (user_id, archived, habit_name)')
+
+
+def _v6_persistence(conn):
+    # Состояние ConversationHandler и user_data, переживающее перезапуск
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS conversations (
+            name TEXT,
+            key TEXT,
+            state TEXT,
+            updated_at INTEGER,
+            PRIMARY KEY (name, key)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations (updated_at)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_data (
+            user_id INTEGER PRIMARY KEY,
+            data TEXT,
+            updated_at INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_user_data_updated_at ON user_data (updated_at)')
+
+
+def _v7_habit_events(conn):
+    # Журнал отметок и удалений (только добавление) и агрегаты по привычке:
+    # серия, время последней отметки и число отметок читаются из habits без обхода журнала.
+    # rowid входит в каждый индекс, поэтому (user_id) и (habit_id) годятся для
+    # постраничного чтения «WHERE user_id = ? AND id < ? ORDER BY id DESC».
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS habit_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            habit_id INTEGER,
+            user_id INTEGER,
+            kind TEXT,
+            amount REAL,
+            progress REAL,
+            created_at INTEGER
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_habit_events_user ON habit_events (user_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_habit_events_habit ON habit_events (habit_id)')
+    _add_column(conn, 'habits', 'streak', 'INTEGER DEFAULT 0')
+    _add_column(conn, 'habits', 'last_completed_at', 'INTEGER')
+    _add_column(conn, 'habits', 'completions', 'INTEGER DEFAULT 0')
+    # Удалённая привычка остаётся в таблице (archived = 1, deleted_at), чтобы не терять историю
+    _add_column(conn, 'habits', 'deleted_at', 'INTEGER')
+
+
+def _v8_quote_rotation(conn):
+    # Ротация цитат пользователя: перестановка пула задаётся seed, cursor — позиция в ней.
+    # size — размер пула, для которого начат цикл: после перезагрузки корпуса цикл начинается заново
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS quote_rotation (
+            user_id INTEGER,
+            pool TEXT,
+            seed INTEGER,
+            cursor INTEGER,
+            size INTEGER,
+            PRIMARY KEY (user_id, pool)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _v9_settings(conn):
+    # Параметры, от которых зависит смысл данных в базе. Привычки, созданные до этой
+    # версии, копили прогресс в режиме stored (другого по умолчанию не было);
+    # у пустой базы режим запишет первый запуск, см. check_progress_mode.
+    conn.execute('CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)')
+    if conn.execute('SELECT 1 FROM habits LIMIT 1').fetchone():
+        conn.execute("INSERT OR IGNORE INTO settings (name, value) VALUES ('progress_mode', ?)", (PROGRESS_STORED,))
+
+
+def _v10_outbox_created_at(conn):
+    # Чистка отправленных напоминаний после каждой рассылки идёт по диапазону created_at
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_outbox_created_at ON reminder_outbox (created_at)')
+
+
+def _v11_habit_created_at(conn):
+    # Ленивый прогресс считается от момента создания привычки, а не от полуночи start_date.
+    # У старых привычек колонка остаётся NULL, и прирост по-прежнему идёт от начала дня
+    _add_column(conn, 'habits', 'created_at', 'INTEGER')
+
+
+MIGRATIONS = [
+    _v1_habits,
+    _v2_due_at,
+    _v3_reminder_outbox,
+    _v4_reminder_slots,
+    _v5_habit_indexes,
+    _v6_persistence,
+    _v7_habit_events,
+    _v8_quote_rotation,
+    _v9_settings,
+    _v10_outbox_created_at,
+    _v11_habit_created_at,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def migrate(db_path):
+    # Возвращает пару (версия до, версия после)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        # journal_mode нельзя менять внутри транзакции; режим WAL сохраняется в файле базы
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            current = conn.execute('PRAGMA user_version').fetchone()[0]
+            for migration in MIGRATIONS[current:]:
+                migration(conn)
+            if current < SCHEMA_VERSION:
+                conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return current, max(current, SCHEMA_VERSION)
+    finally:
+        conn.close()
+
+
+def recorded_progress_mode(conn):
+    row = conn.execute("SELECT value FROM settings WHERE name = 'progress_mode'").fetchone()
+    return row[0] if row else None
+
+
+def check_progress_mode(db_path, mode):
+    # В режиме stored колонка progress уже содержит прирост по времени, в lazy — только
+    # ручные отметки, поэтому запуск не в том режиме молча исказил бы прогресс всех привычек.
+    # Режим пустой базы запоминается при первом запуске; сменить его — convert_progress.py.
+    if mode not in PROGRESS_MODES:
+        raise ValueError(f"Неизвестный режим прогресса '{mode}', ожидается один из {PROGRESS_MODES}")
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute("INSERT OR IGNORE INTO settings (name, value) VALUES ('progress_mode', ?)", (mode,))
+        recorded = recorded_progress_mode(conn)
+    finally:
+        conn.close()
+    if recorded != mode:
+        raise RuntimeError(
+            f"База {db_path} ведёт прогресс в режиме '{recorded}', а бот запущен в режиме '{mode}'. "
+            f"Укажите PROGRESS_MODE={recorded} или переведите базу: python convert_progress.py {mode} --db {db_path}"
+        )
@@ -0,0 +1,54 @@
+from datetime import datetime
+import math
+
+# Режимы хранения прогресса:
+# stored — планировщик каждый час дописывает прирост в колонку progress;
+# lazy   — в progress лежат только ручные отметки, прирост по времени
+#          считается при чтении, а архивирование идёт по индексу due_at.
+# Режим записан в базе (таблица settings) и при запуске сверяется с настройкой.
+PROGRESS_STORED = 'stored'
+PROGRESS_LAZY = 'lazy'
+PROGRESS_MODES = (PROGRESS_STORED, PROGRESS_LAZY)
+
+# Прирост прогресса за час для каждой частоты
+HOURLY_INCREMENTS = {
+    'Ежедневно': (100 / 30) / 24,
+    'Еженедельно': (100 / 4) / 168,
+    'Ежемесячно': 100 / 720,
+}
+
+
+def hourly_increment(frequency):
+    return HOURLY_INCREMENTS.get(frequency, 0)
+
+
+def started_at(start_date, created_at=None):
+    # Прирост начисляется с момента создания привычки. У привычек, созданных
+    # до появления колонки created_at, известна только дата — от её полуночи
+    if created_at is not None:
+        return datetime.fromtimestamp(created_at)
+    return datetime.strptime(start_date, '%Y-%m-%d')
+
+
+def elapsed_hours(started, now=None):
+    # Прирост начисляется за каждый полный час с момента started
+    now = now or datetime.now()
+    return max(0, int((now - started).total_seconds() // 3600))
+
+
+def accrued_progress(frequency, started, now=None):
+    return hourly_increment(frequency) * elapsed_hours(started, now)
+
+
+def effective_progress(frequency, started, manual, total, now=None):
+    return min(total, manual + accrued_progress(frequency, started, now))
+
+
+def due_at(frequency, started, manual, total):
+    # Момент (unix time), когда накопленный прогресс достигнет цели.
+    # None — привычка сама по себе никогда не завершится.
+    rate = hourly_increment(frequency)
+    if rate <= 0:
+        return None
+    hours = max(0, math.ceil((total - manual) / rate))
+    return int(started.timestamp()) + hours * 3600
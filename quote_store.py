@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+import sqlite3
+from array import array
+from collections import defaultdict
+import motivations
+from metrics import QUOTES_LOADED
+
+# Хранилище мотивационных цитат. Корпус (JSONL или SQLite) загружается в компактный
+# индекс: тексты одной строкой байтов со смещениями и массивы номеров цитат по
+# языку и тегу. Каждый пользователь идёт по своей перестановке пула без повторов;
+# его состояние — только seed и позиция (cursor), см. permute.
+
+DEFAULT_LANG = 'ru'
+FEISTEL_ROUNDS = 4
+_MASK64 = (1 << 64) - 1
+
+
+def read_jsonl(path, default_lang=DEFAULT_LANG):
+    # Строка файла: {"text": "...", "lang": "ru", "tags": ["спорт", "утро"]}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            yield item['text'], item.get('lang') or default_lang, item.get('tags') or ()
+
+
+def read_sqlite(path, default_lang=DEFAULT_LANG):
+    # Таблица quotes (text, lang, tags); теги — через запятую
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        for text, lang, tags in conn.execute('SELECT text, lang, tags FROM quotes ORDER BY rowid'):
+            yield text, lang or default_lang, [tag.strip() for tag in (tags or '').split(',') if tag.strip()]
+    finally:
+        conn.close()
+
+
+def read_quotes(path=None, default_lang=DEFAULT_LANG):
+    # Без файла — встроенный список motivations.py
+    if path is None:
+        return ((text, default_lang, ()) for text in motivations.motivations_list)
+    if os.path.splitext(path)[1] in ('.db', '.sqlite', '.sqlite3'):
+        return read_sqlite(path, default_lang)
+    return read_jsonl(path, default_lang)
+
+
+class QuoteIndex:
+    def __init__(self, quotes):
+        data = bytearray()
+        offsets = array('Q', [0])
+        pools = defaultdict(lambda: array('I'))
+        for number, (text, lang, tags) in enumerate(quotes):
+            data += text.encode('utf-8')
+            offsets.append(len(data))
+            lang = lang.lower()
+            pools[lang, None].append(number)
+            for tag in {tag.lower() for tag in tags}:
+                pools[lang, tag].append(number)
+                pools[None, tag].append(number)
+        self._data = bytes(data)
+        self._offsets = offsets
+        self._pools = dict(pools)
+        self._pools[None, None] = range(len(offsets) - 1)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def text(self, number):
+        return self._data[self._offsets[number]:self._offsets[number + 1]].decode('utf-8')
+
+    def select(self, lang=None, tag=None, default_lang=DEFAULT_LANG):
+        # Пул цитат и его ключ для состояния ротации. С тегом — цитаты с тегом на языке
+        # пользователя или на любом; без тега — язык пользователя, язык по умолчанию или все.
+        # Нет ни одной подходящей цитаты — пустой пул.
+        if tag is not None:
+            keys = [(lang, tag), (None, tag)]
+        else:
+            keys = [(lang, None), (default_lang, None), (None, None)]
+        for key in keys:
+            numbers = self._pools.get(key)
+            if numbers:
+                return f'{key[0] or "*"}:{key[1] or ""}', numbers
+        return None, ()
+
+
+def _mix(value):
+    # Финализатор splitmix64: хорошо перемешивает биты и не зависит от версии Python
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+def permute(position, size, seed):
+    # Биекция [0, size) -> [0, size), заданная seed: сеть Фейстеля на ближайшем
+    # сверху чётном числе бит и «прогулка по циклу» для значений вне диапазона
+    # (домен меньше 4 * size, так что в среднем меньше четырёх проходов)
+    if size <= 1:
+        return 0
+    half = max(1, ((size - 1).bit_length() + 1) // 2)
+    mask = (1 << half) - 1
+    value = position
+    while True:
+        left, right = value >> half, value & mask
+        for round_key in range(FEISTEL_ROUNDS):
+            left, right = right, left ^ (_mix((seed + round_key * 0x9E3779B97F4A7C15 + right) & _MASK64) & mask)
+        value = (left << half) | right
+        if value < size:
+            return value
+
+
+class QuoteStore:
+    def __init__(self, path=None, default_lang=DEFAULT_LANG):
+        self.path = path
+        self.default_lang = default_lang
+        # Пока корпус грузится, отвечаем встроенным списком
+        self.index = QuoteIndex(read_quotes(None, default_lang))
+        self._mtime = None
+
+    def _mtime_of_source(self):
+        return os.path.getmtime(self.path) if self.path else None
+
+    def load(self):
+        mtime = self._mtime_of_source()
+        # Индекс заменяется целиком: читатели держат ссылку на старый, пока он им нужен
+        self.index = QuoteIndex(read_quotes(self.path, self.default_lang))
+        self._mtime = mtime
+        QUOTES_LOADED.set(len(self.index))
+        return len(self.index)
+
+    async def reload(self):
+        # Разбор большого корпуса — в потоке, чтобы не останавливать цикл событий.
+        # Ошибка в новом файле оставляет в работе прежний индекс.
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, self.load)
+        except (OSError, ValueError, KeyError, TypeError, sqlite3.Error) as e:
+            print(f"Ошибка загрузки цитат из {self.path}: {e}")
+            return None
+
+    async def reload_if_changed(self):
+        try:
+            changed = self._mtime_of_source() != self._mtime
+        except OSError:
+            changed = False
+        if changed:
+            await self.reload()
+
+    def select(self, lang=None, tag=None):
+        # Индекс возвращается вместе с пулом: перезагрузка между выбором номера и
+        # чтением текста не смешает старый пул с новым корпусом
+        index = self.index
+        pool, numbers = index.select(lang, tag, self.default_lang)
+        return index, pool, numbers
@@ -0,0 +1,184 @@
+import argparse
+import json
+import sqlite3
+import time
+from urllib.request import Request, urlopen
+from habit_repository import DB_PATH
+from sharding import SHARD_ID_BITS, SHARD_MAP_PATH, ShardMap, init_shard, shard_db_path, shard_for
+
+# Таблицы с данными пользователя и выражение, дающее user_id строки.
+# reminder_outbox переезжает вместе с пользователем: при уменьшении числа шардов
+# воркер старого шарда останавливается, и его pending-строки никто бы не дослал.
+# Строку, которую старый шард отправляет прямо во время переноса, может отправить
+# и новый: напоминание лучше повторить, чем потерять.
+USER_TABLES = (
+    ('habits', 'user_id'),
+    ('habit_events', 'user_id'),
+    ('reminder_slots', 'user_id'),
+    ('reminder_outbox', 'user_id'),
+    ('user_data', 'user_id'),
+    ('conversations', "json_extract(key, '$[1]')"),
+    ('quote_rotation', 'user_id'),
+)
+SELECT_SHARD_USERS = (
+    'SELECT user_id FROM habits UNION SELECT user_id FROM reminder_slots '
+    "UNION SELECT user_id FROM reminder_outbox WHERE status = 'pending' "
+    "UNION SELECT user_id FROM user_data UNION SELECT json_extract(key, '$[1]') FROM conversations "
+    'UNION SELECT user_id FROM quote_rotation'
+)
+
+
+def _columns(conn, schema, table):
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def _copy_sql(conn, table, selected, id_limit):
+    # INSERT ... SELECT из исходного шарда в целевой. id ниже id_limit сохраняются;
+    # привычки с id выше получают новые id из habit_map, события — новые id целевого шарда
+    # Новые id событий выдаются по порядку вставки, поэтому журнал копируется по возрастанию id
+    overrides, join, order = {}, '', ''
+    if table == 'habits':
+        overrides['id'] = 'COALESCE(m.new_id, src.id)'
+        join = 'LEFT JOIN temp.habit_map m ON m.old_id = src.id'
+    elif table == 'habit_events':
+        overrides['id'] = f'CASE WHEN src.id < {id_limit} THEN src.id END'
+        overrides['habit_id'] = 'COALESCE(m.new_id, src.habit_id)'
+        join = 'LEFT JOIN temp.habit_map m ON m.old_id = src.habit_id'
+        order = 'ORDER BY src.id'
+    elif table == 'reminder_outbox':
+        # id очереди у шардов не разнесены по диапазонам: строки получают новые id в прежнем порядке
+        overrides['id'] = 'NULL'
+        order = 'ORDER BY src.id'
+    target_columns = set(_columns(conn, 'dst', table))
+    columns = [column for column in _columns(conn, 'main', table) if column in target_columns]
+    values = ', '.join(overrides.get(column, f'src.{column}') for column in columns)
+    return (
+        f'INSERT INTO dst.{table} ({", ".join(columns)}) SELECT {values} FROM main.{table} src {join} '
+        f'WHERE {selected} {order}'
+    )
+
+
+def move_users(db_path, source, new_count):
+    # Переносит из шарда source всех пользователей, которые при new_count шардах
+    # принадлежат другим шардам. Сначала строки копируются в целевой шард
+    # (отдельная транзакция), затем удаляются из исходного. Сбой между шагами
+    # оставляет копию в обоих шардах; повторный запуск перезапишет её.
+    conn = sqlite3.connect(shard_db_path(db_path, source), isolation_level=None)
+    conn.execute('PRAGMA busy_timeout=5000')
+    conn.create_function('target_shard', 1, lambda user_id: shard_for(user_id, new_count), deterministic=True)
+    try:
+        conn.execute('CREATE TEMP TABLE moving (user_id INTEGER PRIMARY KEY, target INTEGER)')
+        conn.execute(
+            f'INSERT INTO temp.moving SELECT user_id, target_shard(user_id) FROM ({SELECT_SHARD_USERS}) '
+            'WHERE user_id IS NOT NULL AND target_shard(user_id) != ?',
+            (source,),
+        )
+        moved = dict(conn.execute('SELECT target, COUNT(*) FROM temp.moving GROUP BY target').fetchall())
+
+        for target in moved:
+            selected = f'user_id IN (SELECT user_id FROM temp.moving WHERE target = {target})'
+            # Шард хранит только id своего диапазона и диапазонов ниже: иначе
+            # AUTOINCREMENT продолжил бы выдачу из чужого диапазона
+            id_limit = (target + 1) << SHARD_ID_BITS
+            conn.execute('ATTACH DATABASE ? AS dst', (shard_db_path(db_path, target),))
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    for table, user_expr in USER_TABLES:
+                        conn.execute(f'DELETE FROM dst.{table} WHERE {user_expr} IN '
+                                     f'(SELECT user_id FROM temp.moving WHERE target = {target})')
+                    next_id = conn.execute(
+                        "SELECT MAX(IFNULL((SELECT MAX(id) FROM dst.habits WHERE id < ?), 0), "
+                        "IFNULL((SELECT seq FROM dst.sqlite_sequence WHERE name = 'habits'), 0))",
+                        (id_limit,),
+                    ).fetchone()[0]
+                    conn.execute('DROP TABLE IF EXISTS temp.habit_map')
+                    conn.execute(
+                        'CREATE TEMP TABLE habit_map AS SELECT id AS old_id, '
+                        f'{next_id} + ROW_NUMBER() OVER (ORDER BY id) AS new_id FROM main.habits '
+                        f'WHERE id >= {id_limit} AND {selected}'
+                    )
+                    for table, user_expr in USER_TABLES:
+                        conn.execute(_copy_sql(
+                            conn, table,
+                            f'{user_expr} IN (SELECT user_id FROM temp.moving WHERE target = {target})', id_limit,
+                        ))
+                    conn.execute('COMMIT')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+            finally:
+                conn.execute('DETACH DATABASE dst')
+
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                for table, user_expr in USER_TABLES:
+                    conn.execute(
+                        f'DELETE FROM main.{table} WHERE {user_expr} IN '
+                        f'(SELECT user_id FROM temp.moving WHERE target = {target})'
+                    )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return moved
+    finally:
+        conn.close()
+
+
+def rebalance(db_path, old_count, new_count):
+    # Возвращает {исходный шард: {целевой шард: число пользователей}}
+    for shard in range(new_count):
+        init_shard(shard_db_path(db_path, shard), shard)
+    return {source: move_users(db_path, source, new_count) for source in range(old_count)}
+
+
+def _admin(router, action, **params):
+    query = '&'.join(f'{key}={value}' for key, value in params.items())
+    request = Request(f'{router}/shards/{action}' + (f'?{query}' if query else ''), method='POST')
+    with urlopen(request, timeout=120) as response:
+        return json.loads(response.read())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Изменение числа шардов с переносом пользователей')
+    parser.add_argument('count', type=int, help='новое число шардов')
+    parser.add_argument('--db', default=DB_PATH, help='путь к базе шарда 0')
+    parser.add_argument('--shard-map', default=SHARD_MAP_PATH)
+    parser.add_argument('--router', help='адрес управления роутера, например http://127.0.0.1:8444; '
+                                         'без него бот должен быть остановлен')
+    args = parser.parse_args()
+
+    shard_map = ShardMap.load(args.shard_map)
+    if args.count < 1 or args.count == shard_map.count:
+        parser.error(f'сейчас шардов: {shard_map.count}; укажите другое число, не меньше 1')
+
+    old_count = shard_map.count
+    if args.router:
+        # Новые шарды создаём до prepare: их воркеры запускаются на готовой схеме
+        for shard in range(args.count):
+            init_shard(shard_db_path(args.db, shard), shard)
+        _admin(args.router, 'prepare', count=args.count)
+    started = time.perf_counter()
+    try:
+        moved = rebalance(args.db, old_count, args.count)
+    except BaseException:
+        if args.router:
+            _admin(args.router, 'abort')
+        raise
+    if args.router:
+        _admin(args.router, 'commit')
+    else:
+        shard_map.count = args.count
+        shard_map.save()
+
+    total = sum(count for targets in moved.values() for count in targets.values())
+    print(f'Шардов: {old_count} -> {args.count}, перенесено пользователей: {total} '
+          f'за {time.perf_counter() - started:.2f} с')
+    for source, targets in moved.items():
+        for target, count in sorted(targets.items()):
+            print(f'  шард {source} -> шард {target}: {count}')
+
+
+if __name__ == '__main__':
+    main()
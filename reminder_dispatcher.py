@@ -0,0 +1,185 @@
+from datetime import timedelta
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden, RetryAfter, TelegramError
+import aiosqlite
+import asyncio
+import json
+import time
+from metrics import (
+    REMINDER_FLOOD_WAIT_SECONDS, REMINDER_FLOOD_WAITS, REMINDER_RETRIES, REMINDER_SEND_SECONDS, REMINDERS
+)
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота и не чаще
+# одного сообщения в секунду в один чат
+GLOBAL_RATE = 30
+PER_CHAT_INTERVAL = 1.0
+CONCURRENCY = 20
+MAX_ATTEMPTS = 5
+BATCH_SIZE = 500
+
+
+def _seconds(value):
+    # RetryAfter.retry_after бывает int или timedelta в зависимости от версии PTB
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def set_rate(self, rate):
+        # Новая доля общего лимита: запас токенов не больше новой ёмкости
+        self.rate = rate
+        self.capacity = rate
+        self._tokens = min(self._tokens, rate)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class ReminderDispatcher:
+    # Рассылает сообщения из таблицы reminder_outbox. Каждая строка помечается
+    # отправленной сразу после успешного send_message, поэтому после перезапуска
+    # рассылка продолжается с первой неотправленной строки.
+    def __init__(self, bot, repository, concurrency=CONCURRENCY, rate=GLOBAL_RATE,
+                 per_chat_interval=PER_CHAT_INTERVAL, max_attempts=MAX_ATTEMPTS):
+        self.bot = bot
+        self.repository = repository
+        self.concurrency = concurrency
+        self.per_chat_interval = per_chat_interval
+        self.max_attempts = max_attempts
+        self.bucket = TokenBucket(rate)
+        self._chat_next_send = {}
+        self._paused_until = 0.0
+        self._running = asyncio.Lock()
+        self._stopping = False
+
+    def set_rate(self, rate):
+        self.bucket.set_rate(rate)
+
+    def stop(self):
+        # Остановка бота: уже начатые отправки завершаются, остальные строки
+        # остаются pending и уйдут после перезапуска (resume_reminders)
+        self._stopping = True
+
+    async def dispatch(self):
+        # Один проход по всем ожидающим сообщениям; параллельные вызовы ждут друг друга
+        async with self._running:
+            stats = {'sent': 0, 'blocked': 0, 'failed': 0, 'retried': 0, 'deferred': 0}
+            queue = asyncio.Queue(maxsize=self.concurrency * 2)
+            workers = [asyncio.create_task(self._worker(queue, stats)) for _ in range(self.concurrency)]
+            try:
+                last_id = 0
+                while not self._stopping:
+                    rows = await self.repository.fetch_pending_outbox(last_id, BATCH_SIZE)
+                    if not rows:
+                        break
+                    for row in rows:
+                        if self._stopping:
+                            break
+                        await queue.put(row)
+                    last_id = rows[-1].id
+                for _ in workers:
+                    await queue.put(None)
+                await asyncio.gather(*workers)
+            finally:
+                for worker in workers:
+                    worker.cancel()
+                self._chat_next_send.clear()
+            await self.repository.purge_outbox()
+            return stats
+
+    async def _worker(self, queue, stats):
+        while True:
+            message = await queue.get()
+            if message is None:
+                return
+            if self._stopping:
+                continue
+            try:
+                status = await self._deliver(message, stats)
+                stats[status] += 1
+                REMINDERS.inc(status=status)
+            except aiosqlite.Error as e:
+                REMINDERS.inc(status='error')
+                print(f"Ошибка базы данных при отправке напоминания {message.id}: {e}")
+            except Exception as e:
+                REMINDERS.inc(status='error')
+                # Воркер не должен падать: иначе очередь встанет. Строка останется
+                # в статусе pending и уйдёт при следующей рассылке.
+                print(f"Ошибка при отправке напоминания {message.id}: {e}")
+
+    async def _wait_turn(self, chat_id):
+        # Лимит на чат, общий лимит бота и общая пауза после RetryAfter
+        now = time.monotonic()
+        slot = max(now, self._chat_next_send.get(chat_id, 0.0))
+        self._chat_next_send[chat_id] = slot + self.per_chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+        await self.bucket.acquire()
+
+        pause = self._paused_until - time.monotonic()
+        if pause > 0:
+            await asyncio.sleep(pause)
+
+    async def _deliver(self, message, stats):
+        attempts = message.attempts
+        reply_markup = None
+        if message.reply_markup:
+            reply_markup = InlineKeyboardMarkup.de_json(json.loads(message.reply_markup), self.bot)
+        while True:
+            await self._wait_turn(message.user_id)
+            attempts += 1
+            try:
+                with REMINDER_SEND_SECONDS.time():
+                    await self.bot.send_message(message.user_id, message.text, reply_markup=reply_markup)
+            except RetryAfter as e:
+                # Флуд-контроль: останавливаем всех воркеров на указанное время
+                pause = _seconds(e.retry_after)
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+                REMINDER_FLOOD_WAITS.inc()
+                REMINDER_FLOOD_WAIT_SECONDS.inc(pause)
+                if self._stopping:
+                    return 'deferred'
+                stats['retried'] += 1
+                attempts -= 1
+                continue
+            except Forbidden:
+                # Пользователь заблокировал бота — больше ему не пишем
+                await self.repository.mark_user_blocked(message.user_id)
+                await self.repository.mark_outbox(message.id, 'blocked', attempts)
+                return 'blocked'
+            except BadRequest as e:
+                print(f"Ошибка при отправке напоминания пользователю {message.user_id}: {e}")
+                await self.repository.mark_outbox(message.id, 'failed', attempts)
+                return 'failed'
+            except TelegramError as e:
+                if attempts >= self.max_attempts:
+                    print(f"Ошибка при отправке напоминания пользователю {message.user_id}: {e}")
+                    await self.repository.mark_outbox(message.id, 'failed', attempts)
+                    return 'failed'
+                if self._stopping:
+                    return 'deferred'
+                stats['retried'] += 1
+                REMINDER_RETRIES.inc()
+                await asyncio.sleep(min(60, 2 ** attempts))
+                continue
+
+            await self.repository.mark_outbox(message.id, 'sent', attempts)
+            return 'sent'
+
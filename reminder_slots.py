@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import zlib
+
+# Часовой пояс по умолчанию — локальное время сервера (None), как и раньше.
+# Если пользователь не выбрал час, напоминание приходит в окно с 9 до 21,
+# а час и минута выводятся из user_id, чтобы рассылка не шла одним всплеском.
+DEFAULT_TIMEZONE = None
+DEFAULT_WINDOW_START = 9
+DEFAULT_WINDOW_HOURS = 12
+
+
+def _spread(user_id):
+    return zlib.crc32(str(user_id).encode())
+
+
+def slot_time(user_id, preferred_hour=None):
+    spread = _spread(user_id)
+    minute = spread % 60
+    if preferred_hour is None:
+        return DEFAULT_WINDOW_START + (spread // 60) % DEFAULT_WINDOW_HOURS, minute
+    return preferred_hour, minute
+
+
+def local_now(timezone, now=None):
+    # now — наивное локальное время сервера или aware datetime
+    now = now or datetime.now()
+    if timezone is None:
+        return now.astimezone().replace(tzinfo=None) if now.tzinfo else now
+    if now.tzinfo is None:
+        now = now.astimezone()
+    return now.astimezone(ZoneInfo(timezone)).replace(tzinfo=None)
+
+
+def next_due_at(user_id, timezone=None, preferred_hour=None, now=None):
+    # Ближайший момент (unix time) строго после now в слоте пользователя
+    hour, minute = slot_time(user_id, preferred_hour)
+    current = local_now(timezone, now)
+    due = current.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if due <= current:
+        due += timedelta(days=1)
+    if timezone is None:
+        return int(due.timestamp())
+    return int(due.replace(tzinfo=ZoneInfo(timezone)).timestamp())
+
+
+def validate_timezone(timezone):
+    try:
+        ZoneInfo(timezone)
+    except (KeyError, ValueError):
+        return False
+    return True
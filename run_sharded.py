@@ -0,0 +1,158 @@
+import asyncio
+import multiprocessing
+import os
+import secrets
+import signal
+from aiohttp import ClientError, ClientSession
+from telegram import Bot, Update
+from habit_repository import DB_PATH
+from progress import PROGRESS_STORED
+from reminder_dispatcher import GLOBAL_RATE
+from shard_router import ShardRouter
+from sharding import SHARD_MAP_PATH, ShardMap, shard_db_path
+from webhook_server import RELOAD_PATH, SECRET_HEADER
+
+WORKER_HOST = '127.0.0.1'
+WORKER_BASE_PORT = 9000
+ADMIN_PORT = 8444
+WORKER_START_TIMEOUT = 60
+
+
+def run_worker(token, shard, shard_count, port, secret_token, db_path, metrics_port, base_url, shard_map_path):
+    # Точка входа процесса-воркера: свой шард базы, свой планировщик и своя доля лимита рассылки
+    from bot_moti import HabitTrackerBot
+
+    # Схему и диапазон id шарда готовит сам бот при открытии пула соединений
+    bot = HabitTrackerBot(
+        token, db_path=shard_db_path(db_path, shard), shard=shard, reminder_rate=GLOBAL_RATE / shard_count,
+        metrics_port=metrics_port + shard if metrics_port else None, base_url=base_url,
+        quotes_path=os.environ.get('QUOTES_PATH'), progress_mode=os.environ.get('PROGRESS_MODE', PROGRESS_STORED),
+        shard_map_path=shard_map_path,
+    )
+    bot.run_shard_worker(WORKER_HOST, port, secret_token)
+
+
+class ShardSupervisor:
+    # Запускает по процессу на шард и останавливает лишние после уменьшения числа шардов
+    def __init__(self, token, db_path=DB_PATH, base_port=WORKER_BASE_PORT, metrics_port=None, base_url=None,
+                 shard_map_path=SHARD_MAP_PATH):
+        self.token = token
+        self.db_path = db_path
+        self.shard_map_path = shard_map_path
+        self.base_port = base_port
+        self.metrics_port = metrics_port
+        self.base_url = base_url
+        # Секрет между роутером и воркерами: воркеры слушают только localhost, но всё же
+        self.worker_secret = secrets.token_hex(16)
+        self.processes = {}
+        self._context = multiprocessing.get_context('spawn')
+
+    def worker_url(self, shard):
+        return f'http://{WORKER_HOST}:{self.base_port + shard}'
+
+    async def _wait_ready(self, shard):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + WORKER_START_TIMEOUT
+        async with ClientSession() as session:
+            while loop.time() < deadline:
+                if not self.processes[shard].is_alive():
+                    raise RuntimeError(f'Воркер шарда {shard} завершился при запуске')
+                try:
+                    async with session.get(self.worker_url(shard) + '/healthz') as response:
+                        if response.status == 200:
+                            return
+                except ClientError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError(f'Воркер шарда {shard} не запустился за {WORKER_START_TIMEOUT} с')
+
+    async def ensure_workers(self, shard_count):
+        started = []
+        for shard in range(shard_count):
+            process = self.processes.get(shard)
+            if process is not None and process.is_alive():
+                continue
+            process = self._context.Process(
+                target=run_worker, name=f'shard-{shard}',
+                args=(self.token, shard, shard_count, self.base_port + shard, self.worker_secret,
+                      self.db_path, self.metrics_port, self.base_url, self.shard_map_path),
+            )
+            process.start()
+            self.processes[shard] = process
+            started.append(shard)
+        await asyncio.gather(*(self._wait_ready(shard) for shard in started))
+
+    async def stop_worker(self, shard):
+        process = self.processes.pop(shard, None)
+        if process is not None:
+            # SIGTERM: воркер дообрабатывает апдейты и закрывает базу
+            process.terminate()
+            await asyncio.get_running_loop().run_in_executor(None, process.join)
+
+    async def reload_workers(self):
+        # Воркеры перечитывают карту шардов: доля лимита рассылки, сброс кэша и
+        # состояние переехавших пользователей. Ответ приходит, когда всё это сделано.
+        headers = {SECRET_HEADER: self.worker_secret}
+        async with ClientSession() as session:
+            async def reload(shard):
+                async with session.post(self.worker_url(shard) + RELOAD_PATH, headers=headers) as response:
+                    if response.status != 200:
+                        raise RuntimeError(f'Воркер шарда {shard} не перечитал карту: HTTP {response.status}')
+            await asyncio.gather(*(reload(shard) for shard in self.processes))
+
+    async def on_prepare(self, new_count):
+        await self.ensure_workers(new_count)
+        # При росте числа шардов старые воркеры сразу уменьшают свою долю лимита
+        await self.reload_workers()
+
+    async def on_commit(self, old_count, new_count):
+        await self.reload_workers()
+
+    async def on_release(self, old_count, new_count):
+        # Пользователи и их очередь напоминаний уже перенесены, лишние воркеры не нужны
+        for shard in [shard for shard in self.processes if shard >= new_count]:
+            await self.stop_worker(shard)
+
+    async def stop(self):
+        for shard in list(self.processes):
+            await self.stop_worker(shard)
+
+
+async def serve(token, webhook_url, host, port, secret_token, db_path=DB_PATH, shard_map_path=SHARD_MAP_PATH,
+                base_port=WORKER_BASE_PORT, admin_port=ADMIN_PORT, metrics_port=None, base_url=None):
+    shard_map = ShardMap.load(shard_map_path)
+    supervisor = ShardSupervisor(token, db_path, base_port, metrics_port, base_url, shard_map_path)
+    router = ShardRouter(
+        shard_map, supervisor.worker_url, host, port, secret_token, supervisor.worker_secret,
+        admin_port=admin_port, on_prepare=supervisor.on_prepare, on_commit=supervisor.on_commit,
+        on_release=supervisor.on_release,
+    )
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await supervisor.ensure_workers(shard_map.count)
+        await router.start()
+        async with Bot(token, **({'base_url': base_url} if base_url else {})) as bot:
+            await bot.set_webhook(webhook_url + router.path, secret_token=secret_token, allowed_updates=Update.ALL_TYPES)
+        print(f"Роутер запущен: шардов {shard_map.count}, управление на 127.0.0.1:{admin_port}")
+        await stop.wait()
+    finally:
+        await router.stop()
+        await supervisor.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(serve(
+        os.environ.get('BOT_TOKEN', 'YOUR_TOKEN'),
+        os.environ['WEBHOOK_URL'],
+        os.environ.get('WEBHOOK_HOST', '0.0.0.0'),
+        int(os.environ.get('WEBHOOK_PORT', 8443)),
+        os.environ.get('WEBHOOK_SECRET'),
+        shard_map_path=os.environ.get('SHARD_MAP', SHARD_MAP_PATH),
+        base_port=int(os.environ.get('SHARD_BASE_PORT', WORKER_BASE_PORT)),
+        admin_port=int(os.environ.get('SHARD_ADMIN_PORT', ADMIN_PORT)),
+        metrics_port=int(os.environ.get('METRICS_PORT', 0)) or None,
+    ))
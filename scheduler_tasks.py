@@ -1,80 +1,194 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from datetime import datetime
 import aiosqlite
 import asyncio
+import functools
+import time
+from metrics import JOB_ERRORS, JOB_LAST_SUCCESS, JOB_ROWS, track_job
+from progress import HOURLY_INCREMENTS, PROGRESS_LAZY, hourly_increment
+from reminder_dispatcher import GLOBAL_RATE, ReminderDispatcher
+from reminder_slots import local_now, next_due_at
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+# Больше кнопок в одном напоминании не показываем, чтобы клавиатура оставалась читаемой
+MAX_DIGEST_BUTTONS = 20
+# Длинные названия обрезаются: 20 строк по MAX_DIGEST_NAME символов
+# с запасом укладываются в лимит Telegram в 4096 символов на сообщение
+MAX_DIGEST_NAME = 100
+# Сколько наступивших слотов напоминаний обрабатываем за один запрос
+REMINDER_BATCH_SIZE = 1000
+
+
+def _short_name(name):
+    return name if len(name) <= MAX_DIGEST_NAME else name[:MAX_DIGEST_NAME - 1] + '…'
+
 
 class SchedulerTasks:
-    def __init__(self, bot):
+    def __init__(self, bot, repository, reminder_rate=GLOBAL_RATE):
         self.bot = bot  # Передаём ссылку на экземпляр бота для отправки сообщений
+        self.repository = repository  # Общий с ботом HabitRepository
+        # В шардированном режиме лимит Telegram делится между воркерами шардов
+        self.dispatcher = ReminderDispatcher(bot, repository, rate=reminder_rate)
+        self.last_reminder_stats = None
         self.scheduler = AsyncIOScheduler()
+        self._running = set()
 
-    def start(self):
-        # Планирование задач
-        self.scheduler.add_job(
-            self.send_reminder, IntervalTrigger(hours=24), id='habit_reminder', replace_existing=True
-        )
-        self.scheduler.add_job(
-            self.update_progress, IntervalTrigger(hours=1), id='progress_update', replace_existing=True
-        )
+    def _tracked(self, job):
+        # AsyncIOScheduler при остановке отменяет идущие корутины задач;
+        # запоминаем их, чтобы при остановке бота дать им доработать
+        @functools.wraps(job)
+        async def run():
+            task = asyncio.current_task()
+            self._running.add(task)
+            try:
+                return await job()
+            finally:
+                self._running.discard(task)
+        return run
+
+    def start(self, run_jobs=True):
+        # Задачи над базой (напоминания, тик прогресса) на одну базу запускает один
+        # воркер; у остальных планировщик выполняет только задачи своего процесса
+        if run_jobs:
+            # Планирование задач. Напоминания разнесены по слотам пользователей,
+            # поэтому раз в минуту забираем только наступившие слоты.
+            self.scheduler.add_job(
+                self._tracked(self.send_reminder), IntervalTrigger(minutes=1), id='habit_reminder', replace_existing=True
+            )
+            # В ленивом режиме прогресс считается при чтении, и раз в час нужно
+            # только заархивировать дошедшие до цели привычки
+            progress_job = self.archive_due_habits if self.repository.progress_mode == PROGRESS_LAZY else self.update_progress
+            self.scheduler.add_job(
+                self._tracked(progress_job), IntervalTrigger(hours=1), id='progress_update', replace_existing=True
+            )
+            # Создаём недостающие слоты и досылаем напоминания, оставшиеся в outbox после прошлого запуска
+            self.scheduler.add_job(
+                self._tracked(self.resume_reminders), DateTrigger(), id='reminder_resume', replace_existing=True
+            )
         self.scheduler.start()
 
+    async def drain(self, timeout):
+        # Новые запуски задач не начинаются, рассылка не берёт новых сообщений;
+        # идущие отправки и тик прогресса дорабатывают, но не дольше timeout.
+        # Возвращает число задач, прерванных по таймауту.
+        if not self.scheduler.running:
+            return 0
+        self.scheduler.pause()
+        self.dispatcher.stop()
+        running = [task for task in self._running if not task.done()]
+        if running:
+            _, running = await asyncio.wait(running, timeout=timeout)
+        self.scheduler.shutdown(wait=False)
+        return len(running)
+
+    @track_job('progress_update')
     async def update_progress(self):
         try:
-            async with aiosqlite.connect('grim_hustle.db') as conn:
-                async with conn.execute(
-                    'SELECT id, habit_name, progress, total, frequency FROM habits WHERE archived = 0'
-                ) as cursor:
-                    habits = await cursor.fetchall()
-
-                for habit in habits:
-                    habit_id, habit_name, progress, total, frequency = habit
-                    increment = self._calculate_increment(frequency, total)
-                    new_progress = progress + increment
-
-                    if new_progress >= total:
-                        await conn.execute(
-                            'UPDATE habits SET progress = ?, archived = 1 WHERE id = ?',
-                            (total, habit_id)
-                        )
-                    else:
-                        await conn.execute(
-                            'UPDATE habits SET progress = ? WHERE id = ?',
-                            (new_progress, habit_id)
-                        )
-                await conn.commit()
+            updated, archived = await self.repository.tick_progress(HOURLY_INCREMENTS)
         except aiosqlite.Error as e:
+            JOB_ERRORS.inc(job='progress_update')
             print(f"Ошибка базы данных при обновлении прогресса: {e}")
+            return
+        JOB_ROWS.inc(updated, job='progress_update', kind='updated')
+        JOB_ROWS.inc(archived, job='progress_update', kind='archived')
+        JOB_LAST_SUCCESS.set(time.time(), job='progress_update')
+
+    @track_job('archive_due')
+    async def archive_due_habits(self):
+        try:
+            archived = await self.repository.archive_due()
+        except aiosqlite.Error as e:
+            JOB_ERRORS.inc(job='archive_due')
+            print(f"Ошибка базы данных при архивировании привычек: {e}")
+            return
+        JOB_ROWS.inc(archived, job='archive_due', kind='archived')
+        JOB_LAST_SUCCESS.set(time.time(), job='archive_due')
 
+    @track_job('send_reminder')
     async def send_reminder(self):
         try:
-            async with aiosqlite.connect('grim_hustle.db') as conn:
-                async with conn.execute(
-                    'SELECT user_id, habit_name, frequency FROM habits WHERE archived = 0'
-                ) as cursor:
-                    habits = await cursor.fetchall()
-
-                for user_id, habit_name, frequency in habits:
-                    if self.should_send_reminder(frequency):
-                        message = f"📌 Напоминание: не забывай про свою привычку '{habit_name}'! Ты на правильном пути к успеху 💪"
-                        try:
-                            await self.bot.send_message(user_id, message)
-                        except Exception as e:
-                            print(f"Ошибка при отправке напоминания пользователю {user_id}: {e}")
+            now = datetime.now()
+            messages_count = due_habits = 0
+            while True:
+                slots = await self.repository.fetch_due_slots(int(now.timestamp()), REMINDER_BATCH_SIZE)
+                if not slots:
+                    break
+
+                # Какие частоты сегодня не напоминаются, зависит от локальной даты
+                # пользователя; пользователей с одинаковым набором берём одним запросом
+                groups = {}
+                run_ids = {}
+                slot_updates = []
+                for slot in slots:
+                    local = local_now(slot.timezone, now)
+                    skip = tuple(f for f in HOURLY_INCREMENTS if not self.should_send_reminder(f, local))
+                    groups.setdefault(skip, []).append(slot.user_id)
+                    run_ids[slot.user_id] = local.strftime('%Y-%m-%d')
+                    slot_updates.append((next_due_at(slot.user_id, slot.timezone, slot.preferred_hour, now), slot.user_id))
+
+                messages = []
+                for skip, user_ids in groups.items():
+                    for user_id, habits in await self.repository.list_reminder_habits_by_user(user_ids, skip):
+                        due_habits += len(habits)
+                        text, reply_markup = self._build_digest(habits)
+                        messages.append((f'{run_ids[user_id]}:u{user_id}', user_id, text, reply_markup.to_json()))
+                await self.repository.enqueue_outbox(messages, slot_updates)
+                messages_count += len(messages)
+                if len(slots) < REMINDER_BATCH_SIZE:
+                    break
+
+            JOB_ROWS.inc(due_habits, job='send_reminder', kind='habits')
+            JOB_ROWS.inc(messages_count, job='send_reminder', kind='messages')
+            if not messages_count:
+                JOB_LAST_SUCCESS.set(time.time(), job='send_reminder')
+                return
+            # Раньше на каждую привычку уходило отдельное сообщение
+            self.last_reminder_stats = {
+                'habits': due_habits, 'messages': messages_count, 'avoided': due_habits - messages_count
+            }
+            print(f"Напоминания: {messages_count} сообщений для {due_habits} привычек, "
+                  f"сэкономлено {due_habits - messages_count}")
+            await self.dispatcher.dispatch()
+            JOB_LAST_SUCCESS.set(time.time(), job='send_reminder')
         except Exception as e:
+            JOB_ERRORS.inc(job='send_reminder')
+            print(f"Ошибка отправки напоминаний: {e}")
+
+    def _build_digest(self, habits):
+        # Одно сообщение на пользователя: список привычек и кнопки для отметки
+        # Список ограничен так же, как кнопки; остальные привычки — одной строкой
+        shown = habits[:MAX_DIGEST_BUTTONS]
+        lines = '\n'.join(f"• {_short_name(habit.habit_name)}" for habit in shown)
+        if len(habits) > len(shown):
+            lines += f"\n…и ещё {len(habits) - len(shown)}"
+        text = (
+            f"📌 Напоминание: не забывай про свои привычки!\n\n{lines}\n\n"
+            "Отметь выполненные кнопками ниже — ты на правильном пути к успеху 💪"
+        )
+        keyboard = [
+            [InlineKeyboardButton(f"✅ {_short_name(habit.habit_name)}", callback_data=f'done:{habit.id}')]
+            for habit in shown
+        ]
+        return text, InlineKeyboardMarkup(keyboard)
+
+    @track_job('reminder_resume')
+    async def resume_reminders(self):
+        try:
+            created = await self.repository.ensure_reminder_slots()
+            JOB_ROWS.inc(created, job='reminder_resume', kind='slots_created')
+            await self.dispatcher.dispatch()
+            JOB_LAST_SUCCESS.set(time.time(), job='reminder_resume')
+        except Exception as e:
+            JOB_ERRORS.inc(job='reminder_resume')
             print(f"Ошибка отправки напоминаний: {e}")
 
     def _calculate_increment(self, frequency, total):
-        if frequency == 'Ежедневно':
-            return (100 / 30) / 24
-        elif frequency == 'Еженедельно':
-            return (100 / 4) / 168
-        elif frequency == 'Ежемесячно':
-            return 100 / 720
-        return 0
+        return hourly_increment(frequency)
 
-    def should_send_reminder(self, frequency):
-        now = datetime.now()
+    def should_send_reminder(self, frequency, now=None):
+        now = now or datetime.now()
         if frequency == 'Ежедневно':
             return True
         elif frequency == 'Еженедельно':
@@ -0,0 +1,167 @@
+from aiohttp import ClientError, ClientSession, web
+from hmac import compare_digest
+import asyncio
+import json
+from sharding import ShardMap, shard_for, update_user_id
+from webhook_server import SECRET_HEADER, WEBHOOK_PATH
+
+ADMIN_HOST = '127.0.0.1'
+# Сколько ждать после начала удержания: воркеры дообрабатывают уже
+# принятые апдейты и сбрасывают отложенную запись состояния диалогов
+SETTLE_SECONDS = 5.0
+
+
+class ShardRouter:
+    # Принимает webhook Telegram и пересылает апдейт воркеру шарда, которому
+    # принадлежит пользователь. Ответ воркера возвращается Telegram как есть:
+    # при ошибке воркера Telegram повторит доставку.
+    #
+    # Перебалансировка: prepare — апдейты переезжающих пользователей задерживаются,
+    # пока rebalance_shards.py переносит их строки; commit — новое число шардов
+    # сохраняется в карту, воркеры подхватывают состояние переехавших (on_commit),
+    # и только затем задержанные апдейты уходят в новые шарды (после них — on_release).
+    def __init__(self, shard_map, worker_url, host='0.0.0.0', port=8443, secret_token=None, worker_secret=None,
+                 path=WEBHOOK_PATH, admin_host=ADMIN_HOST, admin_port=None, settle=SETTLE_SECONDS,
+                 on_prepare=None, on_commit=None, on_release=None):
+        self.shard_map = shard_map
+        self.worker_url = worker_url
+        self.host = host
+        self.port = port
+        self.secret_token = secret_token
+        self.worker_secret = worker_secret
+        self.path = path
+        self.admin_host = admin_host
+        self.admin_port = admin_port
+        self.settle = settle
+        self.on_prepare = on_prepare
+        self.on_commit = on_commit
+        self.on_release = on_release
+        self._pending = None
+        self._released = asyncio.Event()
+        self._session = None
+        self._runners = []
+
+        self.web_app = web.Application()
+        self.web_app.router.add_post(self.path, self.handle_update)
+        self.web_app.router.add_get('/healthz', self.handle_health)
+
+        # Управление шардами — отдельное приложение, доступное только локально
+        self.admin_app = web.Application()
+        self.admin_app.router.add_get('/shards', self.handle_status)
+        self.admin_app.router.add_post('/shards/prepare', self.handle_prepare)
+        self.admin_app.router.add_post('/shards/commit', self.handle_commit)
+        self.admin_app.router.add_post('/shards/abort', self.handle_abort)
+
+    async def route(self, user_id):
+        if user_id is None:
+            return 0
+        # Пока идёт перенос, пользователь, меняющий шард, ждёт commit или abort
+        while self._pending is not None and shard_for(user_id, self._pending) != self.shard_map.shard_for(user_id):
+            await self._released.wait()
+        return self.shard_map.shard_for(user_id)
+
+    async def handle_update(self, request):
+        if self.secret_token and not compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret_token):
+            return web.Response(status=403)
+        body = await request.read()
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+
+        shard = await self.route(update_user_id(data))
+        headers = {'Content-Type': 'application/json'}
+        if self.worker_secret:
+            headers[SECRET_HEADER] = self.worker_secret
+        try:
+            async with self._session.post(self.worker_url(shard) + self.path, data=body, headers=headers) as response:
+                return web.Response(status=response.status)
+        except ClientError as e:
+            print(f"Шард {shard} недоступен: {e}")
+            return web.Response(status=502)
+
+    async def handle_health(self, request):
+        return web.Response(text='ok')
+
+    def _status(self):
+        return {'count': self.shard_map.count, 'pending': self._pending}
+
+    async def handle_status(self, request):
+        return web.json_response(self._status())
+
+    async def handle_prepare(self, request):
+        if self._pending is not None:
+            return web.json_response(self._status(), status=409)
+        try:
+            count = int(request.query['count'])
+        except (KeyError, ValueError):
+            return web.Response(status=400, text='count должно быть числом')
+        if count < 1 or count == self.shard_map.count:
+            return web.Response(status=400, text='count должно отличаться от текущего и быть не меньше 1')
+
+        # Число шардов в переносе записывается в карту до запуска новых воркеров:
+        # по нему воркеры делят общий лимит рассылки (ShardMap.worker_count)
+        self.shard_map.pending = count
+        self.shard_map.save()
+        if self.on_prepare is not None:
+            # Например, запуск воркеров новых шардов
+            try:
+                await self.on_prepare(count)
+            except BaseException:
+                self.shard_map.pending = None
+                self.shard_map.save()
+                raise
+        self._pending = count
+        self._released = asyncio.Event()
+        await asyncio.sleep(self.settle)
+        return web.json_response(self._status())
+
+    async def handle_commit(self, request):
+        if self._pending is None:
+            return web.json_response(self._status(), status=409)
+        old_count, new_count = self.shard_map.count, self._pending
+        # Новая карта сначала только на диске: по ней воркеры находят переехавших
+        # пользователей, а маршрутизация их апдейтов ждёт, пока воркеры не закончат
+        ShardMap(self.shard_map.path, new_count).save()
+        if self.on_commit is not None:
+            try:
+                await self.on_commit(old_count, new_count)
+            except Exception as e:
+                # Строки уже перенесены: переключаемся всё равно
+                print(f"Ошибка при подхвате перенесённых пользователей: {e}")
+        self.shard_map.count = new_count
+        self.shard_map.pending = None
+        self._pending = None
+        self._released.set()
+        if self.on_release is not None:
+            await self.on_release(old_count, new_count)
+        return web.json_response(self._status())
+
+    async def handle_abort(self, request):
+        # Воркеры остаются с меньшей долей лимита до следующего SIGHUP — это безопасно
+        self.shard_map.pending = None
+        self.shard_map.save()
+        self._pending = None
+        self._released.set()
+        return web.json_response(self._status())
+
+    async def start(self):
+        self._session = ClientSession()
+        sites = [(self.web_app, self.host, self.port)]
+        if self.admin_port:
+            sites.append((self.admin_app, self.admin_host, self.admin_port))
+        for app, host, port in sites:
+            runner = web.AppRunner(app, access_log=None)
+            await runner.setup()
+            await web.TCPSite(runner, host, port).start()
+            self._runners.append(runner)
+
+    async def stop(self):
+        for runner in self._runners:
+            await runner.cleanup()
+        self._runners = []
+        # Отпускаем задержанные запросы, чтобы остановка не зависла
+        self._released.set()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
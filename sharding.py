@@ -0,0 +1,108 @@
+import json
+import os
+import sqlite3
+from migrations import migrate
+
+SHARD_MAP_PATH = 'shards.json'
+# Каждый шард выдаёт id привычек и событий журнала из своего диапазона, поэтому
+# при переносе пользователя в шард с большим номером id сохраняются и кнопки
+# «done:<id>» в уже отправленных напоминаниях продолжают работать. При уменьшении
+# числа шардов строки с id из диапазонов выше целевого получают новые id
+# (см. rebalance_shards.move_users)
+SHARD_ID_BITS = 40
+SHARD_ID_TABLES = ('habits', 'habit_events')
+
+
+def jump_hash(key, buckets):
+    # Jump consistent hash (Lamping, Veach): при переходе с N на N+1 шардов
+    # переезжает только 1/(N+1) ключей, и все — в новый шард
+    key &= 0xFFFFFFFFFFFFFFFF
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def shard_for(user_id, shard_count):
+    return jump_hash(user_id, shard_count) if shard_count > 1 else 0
+
+
+def shard_db_path(db_path, shard):
+    # Шард 0 — исходный файл базы, так что переход с одной базы на шарды не требует копирования
+    if shard == 0:
+        return db_path
+    root, ext = os.path.splitext(db_path)
+    return f'{root}.shard{shard}{ext or ".db"}'
+
+
+def init_shard(db_path, shard):
+    # Миграции и начало диапазона id для шарда
+    migrate(db_path)
+    base = shard << SHARD_ID_BITS
+    if not base:
+        return
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        for table in SHARD_ID_TABLES:
+            row = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+            if row is None:
+                conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, base))
+            elif row[0] < base:
+                conn.execute('UPDATE sqlite_sequence SET seq = ? WHERE name = ?', (base, table))
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+
+
+def update_user_id(data):
+    # user_id из сырого апдейта Telegram без разбора в telegram.Update:
+    # роутеру нужен только ключ шарда
+    for key, payload in data.items():
+        if key == 'update_id' or not isinstance(payload, dict):
+            continue
+        user = payload.get('from') or payload.get('user')
+        if user:
+            return user.get('id')
+        chat = payload.get('chat') or (payload.get('message') or {}).get('chat')
+        if chat:
+            return chat.get('id')
+    return None
+
+
+class ShardMap:
+    # Текущее число шардов хранится в JSON-файле рядом с базой.
+    # Файла нет — работает один шард (обычный режим с одной базой).
+    # pending — число шардов, на которое идёт перенос (между prepare и commit).
+    def __init__(self, path=SHARD_MAP_PATH, count=1, pending=None):
+        self.path = path
+        self.count = count
+        self.pending = pending
+
+    @classmethod
+    def load(cls, path=SHARD_MAP_PATH):
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path) as f:
+            data = json.load(f)
+        return cls(path, int(data['count']), data.get('pending'))
+
+    def save(self):
+        # Атомарная замена: читатель никогда не увидит наполовину записанный файл
+        data = {'count': self.count}
+        if self.pending is not None:
+            data['pending'] = self.pending
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def shard_for(self, user_id):
+        return shard_for(user_id, self.count)
+
+    def worker_count(self):
+        # Во время переноса работают воркеры и старых, и новых шардов:
+        # общий лимит рассылки делится на большее из двух чисел
+        return max(self.count, self.pending or 0)
@@ -0,0 +1,192 @@
+from contextlib import suppress
+from telegram.ext import BasePersistence, PersistenceInput
+import aiosqlite
+import asyncio
+import json
+import time
+
+# Брошенные на середине диалоги и их user_data живут сутки
+CONVERSATION_TTL = 24 * 3600
+# Изменения копятся в памяти и пишутся одной транзакцией не чаще раза в FLUSH_DELAY секунд
+FLUSH_DELAY = 2.0
+UPDATE_INTERVAL = 5
+
+
+class SQLitePersistence(BasePersistence):
+    # Хранит состояние ConversationHandler и user_data в той же базе, что и привычки,
+    # чтобы перезапуск между add_habit и set_frequency не терял введённое название.
+    # Запись отложенная: обработчик только меняет словари в памяти.
+    def __init__(self, repository, ttl=CONVERSATION_TTL, flush_delay=FLUSH_DELAY, update_interval=UPDATE_INTERVAL):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.repository = repository
+        self.ttl = ttl
+        self.flush_delay = flush_delay
+        self._conversations = {}
+        self._user_data = None
+        self._dirty_conversations = {}
+        self._dirty_user_data = {}
+        self._flush_task = None
+        self._writing = False
+        self._flushing = False
+
+    def _expire_before(self):
+        return int(time.time()) - self.ttl
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+
+    def _has_pending(self):
+        return bool(self._dirty_conversations or self._dirty_user_data)
+
+    async def _delayed_flush(self):
+        # Пишем, пока есть изменения: всё, что пришло во время записи, уходит
+        # следующей пачкой. Ошибка записи возвращает пачку в очередь до следующей попытки.
+        while self._has_pending() and not self._flushing:
+            await asyncio.sleep(self.flush_delay)
+            self._writing = True
+            try:
+                await self._write_pending()
+            except aiosqlite.Error as e:
+                print(f"Ошибка сохранения состояния диалогов: {e}")
+            finally:
+                self._writing = False
+
+    async def _write_pending(self):
+        conversations, self._dirty_conversations = self._dirty_conversations, {}
+        user_data, self._dirty_user_data = self._dirty_user_data, {}
+        if not conversations and not user_data:
+            return
+        now = int(time.time())
+        try:
+            await self.repository.save_persistence(
+                [(name, json.dumps(key), None if state is None else json.dumps(state), now)
+                 for (name, key), state in conversations.items()],
+                [(user_id, None if data is None else json.dumps(data), now) for user_id, data in user_data.items()],
+                self._expire_before(),
+            )
+        except BaseException:
+            # Изменения, пришедшие во время записи, новее несохранённой пачки
+            self._dirty_conversations = {**conversations, **self._dirty_conversations}
+            self._dirty_user_data = {**user_data, **self._dirty_user_data}
+            raise
+
+    async def get_conversations(self, name):
+        if name not in self._conversations:
+            rows = await self.repository.load_conversations(name, self._expire_before())
+            self._conversations[name] = {tuple(json.loads(key)): json.loads(state) for key, state in rows}
+        return self._conversations[name].copy()
+
+    async def update_conversation(self, name, key, new_state):
+        conversations = self._conversations.setdefault(name, {})
+        if conversations.get(key) == new_state:
+            return
+        if new_state is None:
+            conversations.pop(key, None)
+        else:
+            conversations[key] = new_state
+        self._dirty_conversations[(name, key)] = new_state
+        self._schedule_flush()
+
+    async def get_user_data(self):
+        if self._user_data is None:
+            rows = await self.repository.load_user_data(self._expire_before())
+            self._user_data = {user_id: json.loads(data) for user_id, data in rows}
+        return {user_id: dict(data) for user_id, data in self._user_data.items()}
+
+    async def update_user_data(self, user_id, data):
+        if self._user_data is None:
+            self._user_data = {}
+        if self._user_data.get(user_id) == data:
+            return
+        self._user_data[user_id] = dict(data)
+        self._dirty_user_data[user_id] = dict(data)
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id):
+        if self._user_data is not None:
+            self._user_data.pop(user_id, None)
+        self._dirty_user_data[user_id] = None
+        self._schedule_flush()
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def load_users(self, name, owned):
+        # Состояние пользователей, переехавших в этот шард при перебалансировке.
+        # owned(user_id) отбирает их строки; ключ диалога — (chat_id, user_id).
+        expire_before = self._expire_before()
+        rows = await self.repository.load_conversations(name, expire_before)
+        conversations = {}
+        for key, state in rows:
+            key = tuple(json.loads(key))
+            if owned(key[-1]):
+                conversations[key] = json.loads(state)
+        rows = await self.repository.load_user_data(expire_before)
+        user_data = {user_id: json.loads(data) for user_id, data in rows if owned(user_id)}
+
+        self._conversations.setdefault(name, {}).update(conversations)
+        if self._user_data is None:
+            self._user_data = {}
+        self._user_data.update(user_data)
+        return conversations, user_data
+
+    def forget_users(self, owned):
+        # Пользователи уехали в другой шард вместе со своими строками: забываем их
+        # без записи в базу, иначе отложенная запись вернула бы сюда их состояние
+        for conversations in self._conversations.values():
+            for key in [key for key in conversations if owned(key[-1])]:
+                del conversations[key]
+        for key in [key for key in self._dirty_conversations if owned(key[1][-1])]:
+            del self._dirty_conversations[key]
+        for user_id in [user_id for user_id in self._user_data or () if owned(user_id)]:
+            del self._user_data[user_id]
+        for user_id in [user_id for user_id in self._dirty_user_data if owned(user_id)]:
+            del self._dirty_user_data[user_id]
+
+    async def flush(self):
+        # Вызывается при остановке приложения: дописываем всё, что накопилось.
+        # Отложенная запись либо ещё спит (тогда отменяем её), либо уже пишет —
+        # ждём эту запись, а остаток пишем здесь же, без новой паузы.
+        self._flushing = True
+        try:
+            task = self._flush_task
+            if task is not None and not task.done():
+                if not self._writing:
+                    task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+            await self._write_pending()
+        finally:
+            self._flushing = False
+
+    # Данные чатов, бота и callback_data боту не нужны
+    async def get_chat_data(self):
+        return {}
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def get_bot_data(self):
+        return {}
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def get_callback_data(self):
+        return None
+
+    async def update_callback_data(self, data):
+        pass
@@ -0,0 +1,37 @@
+from datetime import datetime
+
+# Серия — сколько периодов подряд (дней, недель или месяцев, по частоте
+# привычки) в каждом была хотя бы одна отметка. Хранится агрегатом в habits
+# вместе с моментом последней отметки, поэтому чтение не просматривает журнал.
+
+
+def period_index(frequency, moment):
+    day = moment.date() if isinstance(moment, datetime) else moment
+    if frequency == 'Еженедельно':
+        # date(1, 1, 1) — понедельник, так что недели начинаются с понедельника
+        return (day.toordinal() - 1) // 7
+    if frequency == 'Ежемесячно':
+        return day.year * 12 + day.month - 1
+    return day.toordinal()
+
+
+def next_streak(frequency, streak, last_completed_at, now):
+    # Серия после отметки в момент now
+    if last_completed_at is None:
+        return 1
+    last = period_index(frequency, datetime.fromtimestamp(last_completed_at))
+    current = period_index(frequency, now)
+    if last == current:
+        return max(streak, 1)
+    if last == current - 1:
+        return streak + 1
+    return 1
+
+
+def current_streak(frequency, streak, last_completed_at, now=None):
+    # Серия прервана, если целый период прошёл без отметки
+    if not streak or last_completed_at is None:
+        return 0
+    now = now or datetime.now()
+    last = period_index(frequency, datetime.fromtimestamp(last_completed_at))
+    return streak if last >= period_index(frequency, now) - 1 else 0
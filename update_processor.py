@@ -0,0 +1,60 @@
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from collections import deque
+
+# Сколько апдейтов разных пользователей обрабатываем одновременно
+CONCURRENT_UPDATES = 32
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    # Апдейты разных пользователей обрабатываются параллельно, а апдейты одного
+    # чата и пользователя — строго по очереди. Иначе ConversationHandler мог бы
+    # получить «Ежедневно» раньше, чем сохранит название привычки.
+    # Общий лимит BaseUpdateProcessor занимается только на время работы: первый
+    # апдейт пользователя разбирает его очередь, а следующие лишь встают в неё и
+    # сразу освобождают слот. Так частые апдейты одного пользователя не держат
+    # слоты в ожидании и не задерживают остальных.
+    def __init__(self, max_concurrent_updates=CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        self._queues = {}
+
+    @staticmethod
+    def _key(update):
+        if isinstance(update, Update):
+            chat = update.effective_chat
+            user = update.effective_user
+            return chat.id if chat else None, user.id if user else None
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        if key is None:
+            await coroutine
+            return
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(coroutine)
+            return
+
+        queue = self._queues[key] = deque([coroutine])
+        try:
+            while queue:
+                coroutine = queue.popleft()
+                try:
+                    await coroutine
+                except Exception as e:
+                    # Ошибка одного апдейта не должна останавливать очередь пользователя
+                    print(f"Ошибка обработки апдейта: {e}")
+        finally:
+            # При отмене (остановка приложения) не начатые апдейты закрываем
+            for coroutine in queue:
+                coroutine.close()
+            # Очереди неактивных пользователей не копим
+            del self._queues[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        self._queues.clear()
@@ -0,0 +1,61 @@
+from aiohttp import web
+from hmac import compare_digest
+from telegram import Update
+
+WEBHOOK_PATH = '/telegram'
+RELOAD_PATH = '/reload'
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    # Принимает апдейты от Telegram и кладёт их в update_queue приложения.
+    # Ответ отдаётся сразу, обработка идёт в Application с concurrent_updates.
+    # Несколько воркеров на одной базе за балансировщиком требуют привязки
+    # пользователя к воркеру (состояние диалогов каждый держит в памяти) и одного
+    # владельца планировщика: задачи над базой запускает только воркер
+    # с RUN_SCHEDULER=1, у остальных RUN_SCHEDULER=0.
+    def __init__(self, application, host='0.0.0.0', port=8443, secret_token=None, path=WEBHOOK_PATH, on_reload=None):
+        self.application = application
+        self.host = host
+        self.port = port
+        self.secret_token = secret_token
+        self.path = path
+        self._runner = None
+
+        self.web_app = web.Application()
+        self.web_app.router.add_post(self.path, self.handle_update)
+        self.web_app.router.add_get('/healthz', self.handle_health)
+        self.on_reload = on_reload
+        if on_reload is not None:
+            # Воркер шарда: супервизор ждёт ответа, прежде чем отпустить задержанные апдейты
+            self.web_app.router.add_post(RELOAD_PATH, self.handle_reload)
+
+    async def handle_update(self, request):
+        if self.secret_token and not compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret_token):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+
+        await self.application.update_queue.put(Update.de_json(data, self.application.bot))
+        return web.Response()
+
+    async def handle_reload(self, request):
+        if self.secret_token and not compare_digest(request.headers.get(SECRET_HEADER, ''), self.secret_token):
+            return web.Response(status=403)
+        await self.on_reload()
+        return web.Response()
+
+    async def handle_health(self, request):
+        return web.Response(text='ok')
+
+    async def start(self):
+        self._runner = web.AppRunner(self.web_app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None